@@ -1,19 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
-from ..services.database import get_db
+from ..services.database import get_async_db
 from ..services.auth import get_current_admin_user
-from ..services.crud import (
+from ..services.pagination import NEXT_CURSOR_HEADER, next_cursor
+from ..services.crud_async import (
     get_users,
     update_user,
     delete_post,
     get_user_by_id,
     create_moderation_action,
-    get_moderation_actions
+    get_moderation_actions,
+    get_media_bandwidth_report
 )
 from ..models.model import User
-from ..schemas.schema import UserResponse, ModerateAction, ModerationActionResponse
+from ..schemas.schema import UserResponse, ModerateAction, ModerationActionResponse, MediaBandwidthReport
 
 router = APIRouter(
     prefix="/api/admin",
@@ -23,16 +25,21 @@ router = APIRouter(
 
 @router.get("/users", response_model=List[UserResponse])
 async def get_all_users(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all users.
     Admin-only endpoint.
     """
-    users = get_users(db, skip=skip, limit=limit)
+    users = await get_users(db, skip=skip, limit=limit, cursor=cursor)
+    cursor_value = next_cursor(users, limit)
+    if cursor_value:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_value
     return users
 
 @router.put("/users/{user_id}/set-active")
@@ -40,7 +47,7 @@ async def set_user_active_status(
     user_id: int,
     is_active: bool,
     current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Set a user's active status.
@@ -53,11 +60,11 @@ async def set_user_active_status(
             detail="Cannot deactivate your own account"
         )
     
-    user = update_user(db, user_id, is_active=is_active)
+    user = await update_user(db, user_id, is_active=is_active)
     
     # Log moderation action
     action_type = "ACTIVATE_USER" if is_active else "DEACTIVATE_USER"
-    create_moderation_action(
+    await create_moderation_action(
         db, 
         admin_id=current_user.id, 
         action_type=action_type, 
@@ -71,7 +78,7 @@ async def set_user_admin_status(
     user_id: int,
     is_admin: bool,
     current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Set a user's admin status.
@@ -84,11 +91,11 @@ async def set_user_admin_status(
             detail="Cannot remove your own admin status"
         )
     
-    user = update_user(db, user_id, is_admin=is_admin)
+    user = await update_user(db, user_id, is_admin=is_admin)
     
     # Log moderation action
     action_type = "GRANT_ADMIN" if is_admin else "REVOKE_ADMIN"
-    create_moderation_action(
+    await create_moderation_action(
         db, 
         admin_id=current_user.id, 
         action_type=action_type, 
@@ -102,16 +109,16 @@ async def delete_post_admin(
     post_id: int,
     reason: Optional[str] = None,
     current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Delete a post (admin action).
     Admin-only endpoint.
     """
-    result = delete_post(db, post_id, current_user.id, is_admin=True)
+    result = await delete_post(db, post_id, current_user.id, is_admin=True)
     
     # Log moderation action
-    create_moderation_action(
+    await create_moderation_action(
         db, 
         admin_id=current_user.id, 
         action_type="DELETE_POST", 
@@ -125,7 +132,7 @@ async def delete_post_admin(
 async def moderate_content(
     action: ModerateAction,
     current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Take a moderation action.
@@ -154,7 +161,7 @@ async def moderate_content(
     
     # If banning user, check user exists
     if action.action_type == "BAN_USER" and action.target_user_id:
-        user = get_user_by_id(db, action.target_user_id)
+        user = await get_user_by_id(db, action.target_user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -162,11 +169,11 @@ async def moderate_content(
             )
         
         # Ban user (set to inactive)
-        update_user(db, action.target_user_id, is_active=False)
+        await update_user(db, action.target_user_id, is_active=False)
     
     # If unbanning user
     if action.action_type == "UNBAN_USER" and action.target_user_id:
-        user = get_user_by_id(db, action.target_user_id)
+        user = await get_user_by_id(db, action.target_user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -174,10 +181,10 @@ async def moderate_content(
             )
         
         # Unban user (set to active)
-        update_user(db, action.target_user_id, is_active=True)
+        await update_user(db, action.target_user_id, is_active=True)
         
     # Create moderation action record
-    moderation_action = create_moderation_action(
+    moderation_action = await create_moderation_action(
         db,
         admin_id=current_user.id,
         action_type=action.action_type,
@@ -190,14 +197,30 @@ async def moderate_content(
 
 @router.get("/actions", response_model=List[ModerationActionResponse])
 async def get_moderation_action_history(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get history of moderation actions.
     Admin-only endpoint.
     """
-    actions = get_moderation_actions(db, skip=skip, limit=limit)
-    return actions 
\ No newline at end of file
+    actions = await get_moderation_actions(db, skip=skip, limit=limit, cursor=cursor)
+    cursor_value = next_cursor(actions, limit)
+    if cursor_value:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_value
+    return actions
+
+@router.get("/media-report", response_model=MediaBandwidthReport)
+async def get_media_report(
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get uploaded vs stored media bytes, showing what transcoding saves.
+    Admin-only endpoint.
+    """
+    return await get_media_bandwidth_report(db)
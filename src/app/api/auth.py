@@ -1,16 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from ..services.database import get_db
+from ..services.database import get_async_db
 from ..services.auth import (
-    authenticate_user, 
+    authenticate_user_async, 
+    get_password_hash_async,
     create_access_token, 
     get_current_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from ..services.crud import create_user, get_user_by_email
+from ..services.crud_async import create_user, get_user_by_email
 from ..schemas.schema import UserCreate, UserResponse, Token
 
 router = APIRouter(
@@ -20,31 +21,32 @@ router = APIRouter(
 )
 
 @router.post("/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Register a new user.
     """
     # Check if email already exists
-    db_user = get_user_by_email(db, user_data.email)
+    db_user = await get_user_by_email(db, user_data.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
-    # Create the user
-    user = create_user(db, user_data)
+    # Create the user; bcrypt runs on the password hash pool
+    hashed_password = await get_password_hash_async(user_data.password)
+    user = await create_user(db, user_data, hashed_password=hashed_password)
     return user
 
 @router.post("/token", response_model=Token)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get access token for user login (OAuth2 compatible).
     """
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -65,12 +67,12 @@ async def login(
 async def login_with_email(
     email: str,
     password: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Login with email and password directly (non-OAuth2 flow).
     """
-    user = authenticate_user(db, email, password)
+    user = await authenticate_user_async(db, email, password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
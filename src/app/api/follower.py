@@ -1,12 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, update, delete
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 from uuid import UUID
 import math
 
-from ..services.database import get_db
+from ..services.database import get_async_db
 from ..services.auth import get_current_active_user
+from ..services.pagination import paginate, encode_cursor
+from ..services.timeline import backfill_timeline, remove_author_from_timeline
+from ..services.websocket import manager
 from ..models.model import User, UserProfile, Follower
 from ..schemas.schema import (
     FollowCreate, 
@@ -61,12 +65,12 @@ router = APIRouter(tags=["followers"])
            })
 async def follow_user(
     follow_data: FollowCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Follow a user by providing their user ID"""
     # Check if user exists
-    user_to_follow = db.query(User).filter(User.id == follow_data.user_id).first()
+    user_to_follow = await db.get(User, follow_data.user_id)
     if not user_to_follow:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
@@ -75,10 +79,10 @@ async def follow_user(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You cannot follow yourself")
     
     # Check if already following
-    existing_follow = db.query(Follower).filter(
+    existing_follow = await db.scalar(select(Follower).filter(
         Follower.follower_id == current_user.id,
         Follower.following_id == follow_data.user_id
-    ).first()
+    ))
     
     if existing_follow:
         raise HTTPException(
@@ -92,19 +96,37 @@ async def follow_user(
         following_id=follow_data.user_id
     )
     
-    # Update follower and following counts
-    follower_profile = db.query(UserProfile).filter(UserProfile.user_id == current_user.id).first()
-    following_profile = db.query(UserProfile).filter(UserProfile.user_id == follow_data.user_id).first()
+    # Update follower and following counts in place
+    await db.execute(
+        update(UserProfile)
+        .where(UserProfile.user_id == current_user.id)
+        .values(following_count=UserProfile.following_count + 1)
+    )
+    await db.execute(
+        update(UserProfile)
+        .where(UserProfile.user_id == follow_data.user_id)
+        .values(follower_count=UserProfile.follower_count + 1)
+    )
     
-    if follower_profile:
-        follower_profile.following_count += 1
+    db.add(new_follow)
+    try:
+        await db.flush()
+    except IntegrityError:
+        # A concurrent request created the same follow first
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, 
+            detail="You are already following this user"
+        )
     
-    if following_profile:
-        following_profile.follower_count += 1
+    # Bring the followed user's recent posts into the home timeline
+    await db.run_sync(backfill_timeline, current_user.id, follow_data.user_id)
     
-    db.add(new_follow)
-    db.commit()
-    db.refresh(new_follow)
+    await db.commit()
+    await db.refresh(new_follow)
+    
+    # Start routing the followed user's new posts to this user's open sockets
+    await manager.follow(current_user.id, follow_data.user_id)
     
     return new_follow
 
@@ -124,35 +146,42 @@ async def follow_user(
              })
 async def unfollow_user(
     user_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Unfollow a user by their user ID"""
-    # Check if follow relationship exists
-    follow = db.query(Follower).filter(
-        Follower.follower_id == current_user.id,
-        Follower.following_id == user_id
-    ).first()
+    # Delete the follow relationship; no row means we were not following
+    deleted = (await db.execute(
+        delete(Follower).where(
+            Follower.follower_id == current_user.id,
+            Follower.following_id == user_id
+        )
+    )).rowcount
     
-    if not follow:
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="You are not following this user"
         )
     
-    # Update follower and following counts
-    follower_profile = db.query(UserProfile).filter(UserProfile.user_id == current_user.id).first()
-    following_profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+    # Update follower and following counts in place
+    await db.execute(
+        update(UserProfile)
+        .where(UserProfile.user_id == current_user.id, UserProfile.following_count > 0)
+        .values(following_count=UserProfile.following_count - 1)
+    )
+    await db.execute(
+        update(UserProfile)
+        .where(UserProfile.user_id == user_id, UserProfile.follower_count > 0)
+        .values(follower_count=UserProfile.follower_count - 1)
+    )
     
-    if follower_profile and follower_profile.following_count > 0:
-        follower_profile.following_count -= 1
+    # Drop the unfollowed user's posts from the home timeline
+    await db.run_sync(remove_author_from_timeline, current_user.id, user_id)
     
-    if following_profile and following_profile.follower_count > 0:
-        following_profile.follower_count -= 1
+    await db.commit()
     
-    # Delete the follow relationship
-    db.delete(follow)
-    db.commit()
+    await manager.unfollow(current_user.id, user_id)
     
     return None
 
@@ -195,37 +224,37 @@ async def get_user_followers(
     user_id: UUID,
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(10, ge=1, le=100, description="Items per page"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="next_cursor from a previous page; takes precedence over page"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a list of users who follow the specified user"""
     # Check if user exists
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
     # Get total count of followers
-    total = db.query(func.count(Follower.id)).filter(Follower.following_id == user_id).scalar()
+    total = await db.scalar(select(func.count(Follower.id)).filter(Follower.following_id == user_id))
     
     # Calculate pagination
     pages = math.ceil(total / limit)
     offset = (page - 1) * limit
     
     # Get followers with pagination
-    followers = db.query(
-        User, UserProfile
+    query = select(
+        User, UserProfile, Follower
     ).join(
         Follower, User.id == Follower.follower_id
     ).outerjoin(
         UserProfile, User.id == UserProfile.user_id
     ).filter(
         Follower.following_id == user_id
-    ).order_by(
-        Follower.created_at.desc()
-    ).offset(offset).limit(limit).all()
+    )
+    followers = (await db.execute(paginate(query, Follower.created_at, Follower.id, skip=offset, limit=limit, cursor=cursor))).all()
     
     # Format the results
     result_items = []
-    for user, profile in followers:
+    for user, profile, follow in followers:
         display_name = None
         avatar_url = None
         
@@ -243,12 +272,19 @@ async def get_user_followers(
             )
         )
     
+    # Keyset cursor for the next page, taken from the last follow row
+    next_cursor = None
+    if len(followers) == limit:
+        last_follow = followers[-1][2]
+        next_cursor = encode_cursor(last_follow.created_at, last_follow.id)
+    
     return FollowListResponse(
         items=result_items,
         total=total,
         page=page,
         limit=limit,
-        pages=pages
+        pages=pages,
+        next_cursor=next_cursor
     )
 
 @router.get("/api/users/{user_id}/following", response_model=FollowListResponse,
@@ -290,37 +326,37 @@ async def get_user_following(
     user_id: UUID,
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(10, ge=1, le=100, description="Items per page"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="next_cursor from a previous page; takes precedence over page"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a list of users followed by the specified user"""
     # Check if user exists
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
     # Get total count of following
-    total = db.query(func.count(Follower.id)).filter(Follower.follower_id == user_id).scalar()
+    total = await db.scalar(select(func.count(Follower.id)).filter(Follower.follower_id == user_id))
     
     # Calculate pagination
     pages = math.ceil(total / limit)
     offset = (page - 1) * limit
     
     # Get following with pagination
-    following = db.query(
-        User, UserProfile
+    query = select(
+        User, UserProfile, Follower
     ).join(
         Follower, User.id == Follower.following_id
     ).outerjoin(
         UserProfile, User.id == UserProfile.user_id
     ).filter(
         Follower.follower_id == user_id
-    ).order_by(
-        Follower.created_at.desc()
-    ).offset(offset).limit(limit).all()
+    )
+    following = (await db.execute(paginate(query, Follower.created_at, Follower.id, skip=offset, limit=limit, cursor=cursor))).all()
     
     # Format the results
     result_items = []
-    for user, profile in following:
+    for user, profile, follow in following:
         display_name = None
         avatar_url = None
         
@@ -338,12 +374,19 @@ async def get_user_following(
             )
         )
     
+    # Keyset cursor for the next page, taken from the last follow row
+    next_cursor = None
+    if len(following) == limit:
+        last_follow = following[-1][2]
+        next_cursor = encode_cursor(last_follow.created_at, last_follow.id)
+    
     return FollowListResponse(
         items=result_items,
         total=total,
         page=page,
         limit=limit,
-        pages=pages
+        pages=pages,
+        next_cursor=next_cursor
     )
 
 @router.get("/api/users/{user_id}/is-following/{target_id}", 
@@ -370,20 +413,20 @@ async def get_user_following(
 async def check_following_status(
     user_id: UUID,
     target_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Check if a user is following another user"""
     # Check if both users exist
-    user = db.query(User).filter(User.id == user_id).first()
-    target = db.query(User).filter(User.id == target_id).first()
+    user = await db.get(User, user_id)
+    target = await db.get(User, target_id)
     
     if not user or not target:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
     # Check following status
-    is_following = db.query(Follower).filter(
+    is_following = await db.scalar(select(Follower.id).filter(
         Follower.follower_id == user_id,
         Follower.following_id == target_id
-    ).first() is not None
+    )) is not None
     
     return {"is_following": is_following} 
\ No newline at end of file
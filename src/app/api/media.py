@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from ..services.database import get_db
+from ..services.database import get_async_db
 from ..services.auth import get_current_user
-from ..services.media import save_upload_file, save_multiple_files
-from ..services.crud import create_media_file
+from ..services.media import (
+    save_upload_file, save_multiple_files, recording_saved_files, remove_unused_files, stored_file_paths
+)
+from ..services.crud_async import create_media_file, create_media_files, delete_media_file
 from ..models.model import User
 from ..schemas.schema import MediaUploadResponse
 
@@ -19,31 +21,41 @@ router = APIRouter(
 async def upload_media(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Upload a single media file.
     """
     try:
         # Save file to storage
-        file_info = await save_upload_file(file, current_user.id)
+        file_info = await save_upload_file(file, current_user.id, db)
         
         # Save file record to database
-        db_media = create_media_file(
-            db,
-            user_id=current_user.id,
-            filename=file_info["filename"],
-            file_path=file_info["file_path"],
-            file_url=file_info["file_url"],
-            mime_type=file_info["mime_type"],
-            file_size=file_info["file_size"]
-        )
+        async with recording_saved_files(db, [file_info]):
+            db_media = await create_media_file(
+                db,
+                user_id=current_user.id,
+                filename=file_info["filename"],
+                file_path=file_info["file_path"],
+                file_url=file_info["file_url"],
+                mime_type=file_info["mime_type"],
+                file_size=file_info["file_size"],
+                thumbnail_url=file_info["thumbnail_url"],
+                feed_url=file_info["feed_url"],
+                original_size=file_info["original_size"],
+                content_hash=file_info["content_hash"]
+            )
         
         return MediaUploadResponse(
             id=db_media.id,
             filename=db_media.filename,
-            file_url=db_media.file_url
+            file_url=db_media.file_url,
+            thumbnail_url=db_media.thumbnail_url,
+            feed_url=db_media.feed_url
         )
+    except HTTPException:
+        # Rejected uploads keep their status code
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -54,37 +66,60 @@ async def upload_media(
 async def upload_multiple_media(
     files: List[UploadFile] = File(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Upload multiple media files (up to 9).
+    Files are processed in parallel. A rejected file does not fail the
+    others: its entry carries an `error` instead of an id and URL.
     """
     try:
         # Save files to storage
-        file_infos = await save_multiple_files(files, current_user.id)
+        file_infos = await save_multiple_files(files, current_user.id, db)
+        
+        # Save the records of the stored files in one batch
+        async with recording_saved_files(db, file_infos):
+            db_media_files = iter(await create_media_files(
+                db,
+                current_user.id,
+                [file_info for file_info in file_infos if "error" not in file_info]
+            ))
         
-        # Save file records to database
         result = []
         for file_info in file_infos:
-            db_media = create_media_file(
-                db,
-                user_id=current_user.id,
-                filename=file_info["filename"],
-                file_path=file_info["file_path"],
-                file_url=file_info["file_url"],
-                mime_type=file_info["mime_type"],
-                file_size=file_info["file_size"]
-            )
+            if "error" in file_info:
+                result.append(MediaUploadResponse(filename=file_info["filename"], error=file_info["error"]))
+                continue
             
+            db_media = next(db_media_files)
             result.append(MediaUploadResponse(
                 id=db_media.id,
                 filename=db_media.filename,
-                file_url=db_media.file_url
+                file_url=db_media.file_url,
+                thumbnail_url=db_media.thumbnail_url,
+                feed_url=db_media.feed_url
             ))
         
         return result
+    except HTTPException:
+        # Rejected uploads keep their status code
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to upload files: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+@router.delete("/{media_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_media(
+    media_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Delete one of the current user's uploads.
+    Uploads with identical content share their stored files, which are
+    removed together with the last upload that uses them.
+    """
+    media = await delete_media_file(db, media_id, current_user.id)
+    await remove_unused_files(media.content_hash, stored_file_paths(media))
@@ -1,38 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Path
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Path, Response, BackgroundTasks
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Union
-import json
-from datetime import datetime
-import uuid
 
-from ..services.database import get_db
+from ..services.database import get_async_db
 from ..services.auth import get_current_user, get_current_admin_user
-from ..services.crud import (
+from ..services.crud_async import (
     create_post, 
     create_reply,
     get_post,
     get_post_with_author,
     get_feed, 
+    get_home_feed,
     get_user_posts,
     get_post_replies,
     delete_post,
     create_like,
     delete_like,
-    create_repost
+    create_repost,
+    create_media_files
 )
-from ..services.media import save_multiple_files
+from ..services.media import save_multiple_files, failed_uploads, discard_saved_files, recording_saved_files
+from ..services.deletion import get_deletion_job, run_deletion_job
+from ..services.pagination import NEXT_CURSOR_HEADER, next_cursor
 from ..services.websocket import manager
 from ..models.model import User
-from ..schemas.schema import PostCreate, PostResponse, ReplyCreate, PostUpdate, LikeResponse, RepostResponse
-
-# Custom JSON encoder for datetime objects
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, datetime):
-            return o.isoformat()
-        if isinstance(o, uuid.UUID):
-            return str(o)
-        return super().default(o)
+from ..schemas.schema import PostCreate, PostResponse, ReplyCreate, PostUpdate, LikeResponse, RepostResponse, DeletionJobResponse
 
 router = APIRouter(
     prefix="/api/posts",
@@ -44,22 +36,22 @@ router = APIRouter(
 async def create_new_post(
     post_data: PostCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new post.
     """
     # Create the post
-    post = create_post(db, current_user.id, post_data)
+    post = await create_post(db, current_user.id, post_data)
     
     # Get post with author data
-    post_with_author = get_post_with_author(db, post.id)
+    post_with_author = await get_post_with_author(db, post.id)
     
     # Convert to Pydantic model
     post_response = PostResponse.model_validate(post_with_author)
     
     # Broadcast to WebSocket clients (using dict method to avoid serialization issues)
-    await manager.broadcast_post(post_response.model_dump())
+    await manager.broadcast_post(post_response)
     
     return post_response
 
@@ -67,22 +59,22 @@ async def create_new_post(
 async def create_post_reply(
     reply_data: ReplyCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a reply to an existing post.
     """
     # Create the reply
-    reply = create_reply(db, current_user.id, reply_data)
+    reply = await create_reply(db, current_user.id, reply_data)
     
     # Get reply with author data
-    reply_with_author = get_post_with_author(db, reply.id)
+    reply_with_author = await get_post_with_author(db, reply.id)
     
     # Convert to Pydantic model
     reply_response = PostResponse.model_validate(reply_with_author)
     
     # Broadcast to WebSocket clients
-    await manager.broadcast_post(reply_response.model_dump())
+    await manager.broadcast_post(reply_response)
     
     return reply_response
 
@@ -91,110 +83,184 @@ async def create_post_with_images(
     content: str = Query(..., max_length=4000),
     files: List[UploadFile] = File(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new post with uploaded images.
     """
     # Save images
-    file_infos = await save_multiple_files(files, current_user.id)
+    file_infos = await save_multiple_files(files, current_user.id, db)
+    
+    # A post is only created with all of its images
+    errors = failed_uploads(file_infos)
+    if errors:
+        await discard_saved_files(db, file_infos)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": "Some images could not be uploaded", "errors": errors}
+        )
+    
+    # Record the files; the post's images take their variants from these records
+    async with recording_saved_files(db, file_infos):
+        await create_media_files(db, current_user.id, file_infos)
     
     # Extract image URLs
     image_urls = [file_info["file_url"] for file_info in file_infos]
     
     # Create post with image URLs
     post_data = PostCreate(content=content, image_urls=image_urls)
-    post = create_post(db, current_user.id, post_data)
+    post = await create_post(db, current_user.id, post_data)
     
     # Get post with author data
-    post_with_author = get_post_with_author(db, post.id)
+    post_with_author = await get_post_with_author(db, post.id)
     
     # Convert to Pydantic model
     post_response = PostResponse.model_validate(post_with_author)
     
     # Broadcast to WebSocket clients
-    await manager.broadcast_post(post_response.model_dump())
+    await manager.broadcast_post(post_response)
     
     return post_response
 
 @router.get("/feed", response_model=List[PostResponse])
 async def get_post_feed(
+    response: Response,
     skip: int = 0,
     limit: int = 20,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a feed of posts.
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one.
     """
-    posts = get_feed(db, skip=skip, limit=limit)
+    posts = await get_feed(db, skip=skip, limit=limit, cursor=cursor)
+    cursor_value = next_cursor(posts, limit)
+    if cursor_value:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_value
+    return posts
+
+@router.get("/home", response_model=List[PostResponse])
+async def get_home_post_feed(
+    response: Response,
+    skip: int = 0,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get the home feed of the current user: their own posts and posts from accounts they follow.
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one.
+    """
+    posts = await get_home_feed(db, current_user.id, skip=skip, limit=limit, cursor=cursor)
+    cursor_value = next_cursor(posts, limit)
+    if cursor_value:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_value
     return posts
 
 @router.get("/user/{user_id}", response_model=List[PostResponse])
 async def get_posts_by_user(
     user_id: str,
+    response: Response,
     skip: int = 0,
     limit: int = 20,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get posts by a specific user.
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one.
     """
-    posts = get_user_posts(db, user_id, skip=skip, limit=limit)
+    posts = await get_user_posts(db, user_id, skip=skip, limit=limit, cursor=cursor)
+    cursor_value = next_cursor(posts, limit)
+    if cursor_value:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_value
     return posts
 
 @router.get("/{post_id}/replies", response_model=List[PostResponse])
 async def get_replies_to_post(
     post_id: str,
+    response: Response,
     skip: int = 0,
     limit: int = 20,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get replies to a specific post.
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one.
     """
-    replies = get_post_replies(db, post_id, skip=skip, limit=limit)
+    replies = await get_post_replies(db, post_id, skip=skip, limit=limit, cursor=cursor)
+    cursor_value = next_cursor(replies, limit)
+    if cursor_value:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_value
     return replies
 
+@router.get("/delete-jobs/{job_id}", response_model=DeletionJobResponse)
+async def get_post_deletion_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the progress of a background post deletion.
+    Only the user who started the deletion or an admin can read it. Jobs are
+    kept in memory by the worker process that runs them, so with several
+    workers this returns 404 unless the request reaches that worker.
+    """
+    job = get_deletion_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    if job["requested_by"] != current_user.id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized to view this deletion job")
+    return job
+
 @router.get("/{post_id}", response_model=PostResponse)
 async def get_post_by_id(
     post_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a specific post by ID.
     """
-    post = get_post_with_author(db, post_id)
+    post = await get_post_with_author(db, post_id)
     return post
 
 @router.delete("/{post_id}")
 async def delete_post_by_id(
     post_id: str,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Delete a post.
+    Delete a post and all its replies.
     Only the post author or an admin can delete a post.
+    With `background=true` the deletion runs as a job whose progress is
+    available from /api/posts/delete-jobs/{job_id}.
     """
-    result = delete_post(db, post_id, current_user.id, current_user.is_admin)
+    result = await delete_post(db, post_id, current_user.id, current_user.is_admin, background=background)
+    if background:
+        background_tasks.add_task(run_deletion_job, result["job_id"])
     return result
 
 @router.post("/{post_id}/like", response_model=LikeResponse)
 async def like_post(
     post_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Like a post.
     """
-    like = create_like(db, current_user.id, post_id)
+    like = await create_like(db, current_user.id, post_id)
     
     # Convert to Pydantic model
     like_response = LikeResponse.model_validate(like)
     
     # Broadcast to WebSocket clients
-    await manager.broadcast_like(like_response.model_dump())
+    await manager.broadcast_like(like_response)
     
     return like_response
 
@@ -202,29 +268,29 @@ async def like_post(
 async def unlike_post(
     post_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Unlike a post.
     """
-    result = delete_like(db, current_user.id, post_id)
+    result = await delete_like(db, current_user.id, post_id)
     return result
 
 @router.post("/{post_id}/repost", response_model=RepostResponse)
 async def repost_post(
     post_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Repost a post.
     """
-    repost = create_repost(db, current_user.id, post_id)
+    repost = await create_repost(db, current_user.id, post_id)
     
     # Convert to Pydantic model
     repost_response = RepostResponse.model_validate(repost)
     
     # Broadcast to WebSocket clients
-    await manager.broadcast_repost(repost_response.model_dump())
+    await manager.broadcast_repost(repost_response)
     
     return repost_response
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from ..services.database import get_db
+from ..services.database import get_async_db
 from ..services.auth import get_current_user, get_current_admin_user
-from ..services.crud import get_profile, update_profile, get_user_by_id, get_user_posts
+from ..services.crud_async import get_profile, update_profile, get_user_by_id, get_user_posts
+from ..services.pagination import NEXT_CURSOR_HEADER, next_cursor
 from ..models.model import User
 from ..schemas.schema import ProfileResponse, ProfileUpdate, PostResponse
 
@@ -17,34 +18,34 @@ router = APIRouter(
 @router.get("/me", response_model=ProfileResponse)
 async def get_my_profile(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get the profile of the currently authenticated user.
     """
-    return get_profile(db, current_user.id)
+    return await get_profile(db, current_user.id)
 
 @router.put("/me", response_model=ProfileResponse)
 async def update_my_profile(
     profile_data: ProfileUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update the profile of the currently authenticated user.
     """
-    return update_profile(db, current_user.id, profile_data.model_dump(exclude_unset=True))
+    return await update_profile(db, current_user.id, profile_data.model_dump(exclude_unset=True))
 
 @router.get("/{user_id}", response_model=ProfileResponse)
 async def get_user_profile(
     user_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a user's profile by user ID.
     """
     # Check if user exists
-    user = get_user_by_id(db, user_id)
+    user = await get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -52,20 +53,22 @@ async def get_user_profile(
         )
     
     # Get profile
-    return get_profile(db, user_id)
+    return await get_profile(db, user_id)
 
 @router.get("/{user_id}/posts", response_model=List[PostResponse])
 async def get_user_profile_posts(
     user_id: str,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all posts by a specific user, accessed via their profile.
     """
     # Check if user exists
-    user = get_user_by_id(db, user_id)
+    user = await get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -73,21 +76,25 @@ async def get_user_profile_posts(
         )
     
     # Get posts
-    return get_user_posts(db, user_id, skip=skip, limit=limit)
+    posts = await get_user_posts(db, user_id, skip=skip, limit=limit, cursor=cursor)
+    cursor_value = next_cursor(posts, limit)
+    if cursor_value:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_value
+    return posts
 
 @router.put("/{user_id}", response_model=ProfileResponse)
 async def update_user_profile_admin(
     user_id: str,
     profile_data: ProfileUpdate,
     current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Admin endpoint to update any user's profile.
     Requires admin privileges.
     """
     # Check if user exists
-    user = get_user_by_id(db, user_id)
+    user = await get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -95,4 +102,4 @@ async def update_user_profile_admin(
         )
     
     # Update profile
-    return update_profile(db, user_id, profile_data.model_dump(exclude_unset=True)) 
\ No newline at end of file
+    return await update_profile(db, user_id, profile_data.model_dump(exclude_unset=True)) 
\ No newline at end of file
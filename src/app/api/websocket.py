@@ -1,14 +1,12 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query, status
-from sqlalchemy.orm import Session
-import asyncio
 from jose import jwt, JWTError
 from typing import Optional
 import json
 import uuid
 
-from ..services.database import get_db
+from ..services.database import AsyncSessionLocal
 from ..services.auth import SECRET_KEY, ALGORITHM, get_token_data
-from ..services.websocket import manager, heartbeat
+from ..services.websocket import manager, parse_topic, notification_topic
 from ..models.model import User
 
 router = APIRouter(tags=["websocket"])
@@ -16,11 +14,20 @@ router = APIRouter(tags=["websocket"])
 @router.websocket("/api/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
-    token: Optional[str] = Query(None)
+    token: Optional[str] = Query(None),
+    since: Optional[str] = Query(None),
+    topics: Optional[str] = Query(None)
 ):
     """
     WebSocket endpoint for real-time updates.
     If a token is provided, the connection will be associated with that user.
+    Clients choose which events they receive by sending
+    {"action": "subscribe" | "unsubscribe", "topic": "<topic>"}; see
+    services/websocket.py for the available topics.
+    Every event carries a "seq" token; reconnecting with ?since=<seq> replays
+    the events missed in between, or answers {"type": "resync"} when it cannot.
+    Only events of the topics subscribed on connect are replayed, so clients
+    resuming with other topics pass them as ?topics=feed,post:<id>.
     """
     # Initialize connection
     user_id = None
@@ -36,10 +43,22 @@ async def websocket_endpoint(
             # If token validation fails, still connect but without user association
             pass
     
-    await manager.connect(websocket, user_id)
+    # Topics to subscribe to instead of the defaults, before anything is replayed
+    subscriptions = None
+    invalid_topics = []
+    if topics is not None:
+        subscriptions = []
+        for name in filter(None, (name.strip() for name in topics.split(","))):
+            topic = parse_topic(name, user_id)
+            if topic is None:
+                invalid_topics.append(name)
+            else:
+                subscriptions.append(topic)
     
-    # Start heartbeat
-    heartbeat_task = asyncio.create_task(heartbeat(websocket))
+    # Heartbeats are sent by the manager's scheduler
+    await manager.connect(websocket, user_id, topics=subscriptions, since=since)
+    if invalid_topics:
+        await manager.send(websocket, {"status": "error", "message": "Invalid topic", "topics": invalid_topics})
     
     try:
         while True:
@@ -49,29 +68,43 @@ async def websocket_endpoint(
             # Process message (can be extended)
             try:
                 message = json.loads(data)
-                # Handle different message types here if needed
+                is_dict = isinstance(message, dict)
+                action = message.get("action") if is_dict else None
                 
-                # Echo back for now
-                await websocket.send_text(json.dumps({"status": "received", "message": message}))
+                # Any message shows the client is alive; a pong needs no reply
+                manager.record_activity(websocket)
+                if is_dict and message.get("type") == "pong":
+                    continue
+                
+                if action in ("subscribe", "unsubscribe"):
+                    topic = parse_topic(message.get("topic"), user_id)
+                    if topic is None:
+                        await manager.send(websocket, {"status": "error", "message": "Invalid topic"})
+                    elif action == "unsubscribe":
+                        manager.unsubscribe(websocket, topic)
+                        await manager.send(websocket, {"status": "unsubscribed", "topic": topic})
+                    elif manager.subscribe(websocket, topic):
+                        await manager.send(websocket, {"status": "subscribed", "topic": topic})
+                    else:
+                        await manager.send(websocket, {"status": "error", "message": "Too many subscriptions"})
+                    continue
+                
+                # Echo back anything else
+                await manager.send(websocket, {"status": "received", "message": message})
             except json.JSONDecodeError:
                 # Not a valid JSON
-                await websocket.send_text(json.dumps({"status": "error", "message": "Invalid JSON"}))
+                await manager.send(websocket, {"status": "error", "message": "Invalid JSON"})
     except WebSocketDisconnect:
         # Client disconnected
         manager.disconnect(websocket, user_id)
-        # Cancel heartbeat
-        heartbeat_task.cancel()
     except Exception as e:
         # Other errors
         manager.disconnect(websocket, user_id)
-        # Cancel heartbeat
-        heartbeat_task.cancel()
 
 @router.websocket("/api/ws/notifications")
 async def websocket_notifications(
     websocket: WebSocket,
     token: str = Query(...),  # Token is required for notifications
-    db: Session = Depends(get_db)
 ):
     """
     WebSocket endpoint for user-specific notifications.
@@ -93,34 +126,34 @@ async def websocket_notifications(
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
             
-        user = db.query(User).filter(User.id == user_id).first()
+        # Short-lived session so no connection is held for the socket's lifetime
+        async with AsyncSessionLocal() as db:
+            user = await db.get(User, user_id)
         if not user or not user.is_active:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
             
-        # Accept connection
-        await manager.connect(websocket, user_id)
+        # Accept connection; this stream only carries the user's own notifications
+        await manager.connect(websocket, user_id, topics=[notification_topic(user_id)])
         
         # Send welcome message
-        await websocket.send_json({
+        await manager.send(websocket, {
             "type": "connected",
             "message": f"Connected to notification stream for user {user_id}"
         })
         
-        # Start heartbeat task
-        heartbeat_task = asyncio.create_task(heartbeat(websocket))
-        
         try:
             # Handle incoming messages (if any)
             while True:
-                # This is mainly to detect disconnection
-                await websocket.receive_text()
+                # This is mainly to detect disconnection and answered heartbeats
+                data = await websocket.receive_text()
+                manager.record_activity(websocket)
         except WebSocketDisconnect:
             # Client disconnected
-            manager.disconnect(websocket, user_id)
+            pass
         finally:
-            # Cancel heartbeat task
-            heartbeat_task.cancel()
+            # Stop the connection's writer and heartbeats
+            manager.disconnect(websocket, user_id)
             
     except (JWTError, ValueError):
         # Invalid token
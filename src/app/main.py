@@ -10,7 +10,11 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Import service modules
-from .services.database import engine, Base, init_db, wait_for_db, apply_migrations
+from .services.database import engine, Base, init_db, wait_for_db, get_pool_snapshot
+from .services.counters import counter_buffer
+from .services.auth import password_hash_pool, user_cache
+from .services.websocket import manager
+from .services.media import shutdown_variant_pool
 
 # Import models for reference
 from .models.model import User, UserProfile, Post, PostImage, Like, Repost, MediaFile, ModerationAction
@@ -96,6 +100,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Keyset pagination cursor for list endpoints
 )
 
 # Create static files directory if not exist
@@ -124,13 +129,32 @@ async def startup_db_client():
     logger.info("Starting up database client...")
     # Wait for database to be available
     if wait_for_db():
-        # Initialize database with improved function that handles UUID support
+        # Initialize database with improved function that handles UUID support;
+        # this also applies pending column migrations
         init_db()
-        # Apply any pending migrations
-        apply_migrations()
         logger.info("Database initialized successfully")
     else:
         logger.error("Failed to connect to database")
+    # Start writing buffered like/repost counts, if enabled
+    counter_buffer.start()
+
+# Receive WebSocket events published by other workers
+@app.on_event("startup")
+async def startup_websocket_backplane():
+    await manager.start()
+
+# Write out buffered counters before the worker exits
+@app.on_event("shutdown")
+async def shutdown_counter_buffer():
+    await counter_buffer.stop()
+
+@app.on_event("shutdown")
+async def shutdown_websocket_backplane():
+    await manager.stop()
+
+@app.on_event("shutdown")
+async def shutdown_media_workers():
+    shutdown_variant_pool()
 
 @app.get("/", tags=["core"], summary="Root endpoint", 
          description="Endpoint root that returns a simple greeting message.", 
@@ -207,6 +231,153 @@ async def health():
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching system metrics: {str(e)}")
+
+@app.get("/health/db-pool", tags=["core"], summary="Database pool metrics",
+            description="Endpoint to inspect database connection pool saturation for this worker.",
+            response_description="Pool usage of the sync and async engines.",
+            responses={
+                200: {
+                    "description": "Pool metrics retrieved successfully",
+                    "content": {
+                        "application/json": {
+                            "example": {
+                                "async": {
+                                    "pool_class": "TimedAsyncAdaptedQueuePool",
+                                    "pool_size": 10,
+                                    "max_overflow": 10,
+                                    "checked_in": 4,
+                                    "checked_out": 6,
+                                    "overflow": 0,
+                                    "timeout_seconds": 30.0,
+                                    "checkouts": 10234,
+                                    "timeouts": 0,
+                                    "total_wait_seconds": 1.532,
+                                    "avg_wait_seconds": 0.00015,
+                                    "max_wait_seconds": 0.041
+                                }
+                            }
+                        }
+                    },
+                },
+            })
+async def db_pool_health():
+    return get_pool_snapshot()
+
+@app.get("/health/counters", tags=["core"], summary="Counter buffer metrics",
+            description="Endpoint to inspect the write-behind like/repost counter buffer of this worker.",
+            response_description="Counter buffer state and flush statistics.",
+            responses={
+                200: {
+                    "description": "Counter buffer metrics retrieved successfully",
+                    "content": {
+                        "application/json": {
+                            "example": {
+                                "enabled": True,
+                                "flush_interval_ms": 250,
+                                "pending_posts": 3,
+                                "flushes": 1840,
+                                "flushed_rows": 5210,
+                                "flush_errors": 0
+                            }
+                        }
+                    },
+                },
+            })
+async def counter_buffer_health():
+    return counter_buffer.snapshot()
+
+@app.get("/health/password-hashing", tags=["core"], summary="Password hashing metrics",
+            description="Endpoint to inspect the bcrypt worker pool of this worker.",
+            response_description="Concurrency, queueing and timing of password hashing.",
+            responses={
+                200: {
+                    "description": "Password hashing metrics retrieved successfully",
+                    "content": {
+                        "application/json": {
+                            "example": {
+                                "bcrypt_rounds": 12,
+                                "max_workers": 4,
+                                "running": 2,
+                                "queued": 0,
+                                "max_queued": 11,
+                                "completed": 5120,
+                                "avg_wait_seconds": 0.0213,
+                                "max_wait_seconds": 0.734,
+                                "avg_hash_seconds": 0.2481
+                            }
+                        }
+                    },
+                },
+            })
+async def password_hashing_health():
+    return password_hash_pool.snapshot()
+
+@app.get("/health/auth-cache", tags=["core"], summary="Authenticated-user cache metrics",
+            description="Endpoint to inspect the cache get_current_user reads users from in this worker.",
+            response_description="Size, hit and miss counters of the user cache.",
+            responses={
+                200: {
+                    "description": "User cache metrics retrieved successfully",
+                    "content": {
+                        "application/json": {
+                            "example": {
+                                "ttl_seconds": 30.0,
+                                "max_size": 10000,
+                                "size": 812,
+                                "hits": 95310,
+                                "misses": 4120,
+                                "hit_ratio": 0.9586,
+                                "evictions": 0,
+                                "invalidations": 3
+                            }
+                        }
+                    },
+                },
+            })
+async def auth_cache_health():
+    return user_cache.snapshot()
+
+@app.get("/health/websocket", tags=["core"], summary="WebSocket delivery metrics",
+            description="Endpoint to inspect WebSocket connections and their send queues in this worker.",
+            response_description="Connection counts, queue depth and dropped messages.",
+            responses={
+                200: {
+                    "description": "WebSocket metrics retrieved successfully",
+                    "content": {
+                        "application/json": {
+                            "example": {
+                                "connections": 1520,
+                                "users": 980,
+                                "queue_size": 256,
+                                "overflow_policy": "disconnect",
+                                "queued_messages": 37,
+                                "max_queue_depth": 12,
+                                "enqueued_messages": 884120,
+                                "dropped_messages": 4,
+                                "overflow_disconnects": 4,
+                                "replay": {
+                                    "epoch": "3f9c2a1b",
+                                    "seq": 83702,
+                                    "buffered": 1000,
+                                    "capacity": 1000,
+                                    "replayed_messages": 2210,
+                                    "resyncs": 12
+                                },
+                                "pubsub": {
+                                    "backend": "redis",
+                                    "channel": "social_board:events",
+                                    "published": 20931,
+                                    "received": 83702,
+                                    "publish_errors": 0,
+                                    "reconnects": 1
+                                }
+                            }
+                        }
+                    },
+                },
+            })
+async def websocket_health():
+    return manager.snapshot()
     
 @app.get("/static/{file_path:path}", tags=["core"], summary="Static file endpoint",
             description="Endpoint to serve static files.",
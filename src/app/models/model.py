@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Table, Float, UniqueConstraint, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Table, Float, UniqueConstraint, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
@@ -32,6 +32,11 @@ class User(Base):
     followers = relationship("Follower", back_populates="following_user", foreign_keys="Follower.following_id")
     following = relationship("Follower", back_populates="follower_user", foreign_keys="Follower.follower_id")
 
+    # Keyset pagination index for the admin user list
+    __table_args__ = (
+        Index('ix_users_created_at_id', 'created_at', 'id'),
+    )
+
     def __repr__(self):
         return f"<User(id={self.id}, email='{self.email}', username='{self.username}')>"
 
@@ -83,6 +88,14 @@ class Post(Base):
     original_post = relationship("Post", foreign_keys=[original_post_id], remote_side=[id], backref="reposts_of")
     reply_to_post = relationship("Post", foreign_keys=[reply_to_post_id], remote_side=[id], backref="replies")
 
+    # Keyset pagination indexes for the feed, user timelines and reply lists
+    __table_args__ = (
+        Index('ix_posts_created_at_id', 'created_at', 'id'),
+        Index('ix_posts_author_id_created_at_id', 'author_id', 'created_at', 'id'),
+        Index('ix_posts_reply_to_post_id_created_at_id', 'reply_to_post_id', 'created_at', 'id'),
+        Index('ix_posts_original_post_id', 'original_post_id'),
+    )
+
     def __repr__(self):
         return f"<Post(id={self.id}, author_id={self.author_id})>"
 
@@ -92,10 +105,17 @@ class PostImage(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     post_id = Column(UUID(as_uuid=True), ForeignKey("posts.id"), nullable=False)
     image_url = Column(String, nullable=False)
+    # Downscaled variants of the image; NULL for images uploaded before they existed
+    thumbnail_url = Column(String, nullable=True)
+    feed_url = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationship
     post = relationship("Post", back_populates="images")
+    
+    __table_args__ = (
+        Index('ix_post_images_post_id_created_at', 'post_id', 'created_at'),
+    )
 
     def __repr__(self):
         return f"<PostImage(id={self.id}, post_id={self.post_id})>"
@@ -115,6 +135,8 @@ class Like(Base):
     # Unique constraint to prevent multiple likes by the same user
     __table_args__ = (
         UniqueConstraint('user_id', 'post_id', name='unique_user_post_like'),
+        # The unique constraint leads with user_id, so lookups by post need their own index
+        Index('ix_likes_post_id_created_at', 'post_id', 'created_at'),
     )
 
     def __repr__(self):
@@ -135,6 +157,7 @@ class Repost(Base):
     # Unique constraint to prevent multiple reposts by the same user
     __table_args__ = (
         UniqueConstraint('user_id', 'post_id', name='unique_user_post_repost'),
+        Index('ix_reposts_post_id_created_at', 'post_id', 'created_at'),
     )
 
     def __repr__(self):
@@ -147,10 +170,19 @@ class MediaFile(Base):
     filename = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
     file_url = Column(String, nullable=False)
+    thumbnail_url = Column(String, nullable=True)
+    feed_url = Column(String, nullable=True)
     mime_type = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)  # Size in bytes
+    original_size = Column(Integer, nullable=True)  # Size as uploaded, before transcoding
+    content_hash = Column(String, nullable=True)  # SHA-256 of the upload; records with the same hash share files
     uploader_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_media_files_uploader_id_created_at', 'uploader_id', 'created_at'),
+        Index('ix_media_files_content_hash', 'content_hash'),
+    )
 
     def __repr__(self):
         return f"<MediaFile(id={self.id}, filename='{self.filename}')>"
@@ -166,6 +198,11 @@ class ModerationAction(Base):
     reason = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # Keyset pagination index for the moderation history
+    __table_args__ = (
+        Index('ix_moderation_actions_created_at_id', 'created_at', 'id'),
+    )
+    
     def __repr__(self):
         return f"<ModerationAction(id={self.id}, action_type='{self.action_type}')>"
 
@@ -184,9 +221,32 @@ class Follower(Base):
     # Unique constraint to prevent duplicate follows
     __table_args__ = (
         UniqueConstraint('follower_id', 'following_id', name='unique_follower_following'),
+        # Keyset pagination indexes for follower and following lists
+        Index('ix_followers_following_id_created_at_id', 'following_id', 'created_at', 'id'),
+        Index('ix_followers_follower_id_created_at_id', 'follower_id', 'created_at', 'id'),
     )
 
     def __repr__(self):
         return f"<Follower(follower_id={self.follower_id}, following_id={self.following_id})>"
 
 
+class TimelineEntry(Base):
+    __tablename__ = "timeline_entries"
+    # Materialized home timeline: one row per (follower, post) written at post time
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    post_id = Column(UUID(as_uuid=True), ForeignKey("posts.id"), primary_key=True)
+    author_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Reading a user's timeline newest first
+        Index('ix_timeline_entries_user_id_created_at_post_id', 'user_id', 'created_at', 'post_id'),
+        # Removing a followee's posts on unfollow, and entries of a deleted post
+        Index('ix_timeline_entries_user_id_author_id', 'user_id', 'author_id'),
+        Index('ix_timeline_entries_post_id', 'post_id'),
+        # Trimming entries past the retention period
+        Index('ix_timeline_entries_created_at', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f"<TimelineEntry(user_id={self.user_id}, post_id={self.post_id})>"
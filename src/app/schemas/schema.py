@@ -62,7 +62,9 @@ class ProfileResponse(ProfileBase):
 # Post schemas
 class PostImageResponse(BaseModel):
     id: UUID4
-    image_url: str
+    image_url: str  # Full resolution
+    thumbnail_url: Optional[str] = None
+    feed_url: Optional[str] = None  # Sized for the feed
     
     model_config = ConfigDict(from_attributes=True)
 
@@ -109,6 +111,16 @@ class PostResponse(PostBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class DeletionJobResponse(BaseModel):
+    id: str
+    post_id: UUID4
+    status: str  # pending, running, completed, failed
+    total: int
+    deleted: int
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
 # Interaction schemas
 class LikeCreate(BaseModel):
     post_id: UUID4
@@ -134,12 +146,29 @@ class RepostResponse(BaseModel):
 
 # Media schemas
 class MediaUploadResponse(BaseModel):
-    id: UUID4
+    id: Optional[UUID4] = None
     filename: str
-    file_url: str
+    file_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    feed_url: Optional[str] = None
+    error: Optional[str] = None  # Set instead of id and file_url when this file was rejected
     
     model_config = ConfigDict(from_attributes=True)
 
+class MediaTypeUsage(BaseModel):
+    mime_type: str  # Type as stored
+    files: int
+    original_bytes: int
+    stored_bytes: int
+
+class MediaBandwidthReport(BaseModel):
+    files: int
+    original_bytes: int  # Bytes as uploaded
+    stored_bytes: int  # Bytes served, after transcoding
+    saved_bytes: int
+    saved_ratio: float
+    types: List[MediaTypeUsage]
+
 # Admin schemas
 class ModerateAction(BaseModel):
     action_type: str  # DELETE_POST, BAN_USER, etc.
@@ -185,5 +214,6 @@ class FollowListResponse(BaseModel):
     page: int
     limit: int
     pages: int
+    next_cursor: Optional[str] = None
     
     model_config = ConfigDict(from_attributes=True)
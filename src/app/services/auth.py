@@ -3,21 +3,167 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from typing import Optional
+import asyncio
 import os
+import threading
+import time
 import uuid
 
 from ..schemas.schema import TokenData
 from ..models.model import User
-from .database import get_db
+from .database import get_async_db
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")  # In production, use env variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# bcrypt work factor; every extra round doubles the cost of hashing and verifying
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Maximum number of passwords hashed or verified at the same time per worker process
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", str(min(4, os.cpu_count() or 1))))
+
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class PasswordHashPool:
+    """
+    Bounded thread pool for bcrypt work.
+    bcrypt releases the GIL while it hashes, so running it here keeps the
+    event loop (and every WebSocket on it) responsive during a login burst.
+    Calls beyond the concurrency limit wait in the executor queue; how many
+    wait and for how long is recorded for tuning.
+    """
+    def __init__(self, max_workers: int = PASSWORD_HASH_CONCURRENCY):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    async def run(self, function, *args):
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        def job():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                waited = started - submitted
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            try:
+                return function(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.total_run += time.perf_counter() - started
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, job)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "max_workers": self.max_workers,
+                "running": self.running,
+                "queued": self.queued,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "avg_wait_seconds": round(self.total_wait / self.completed, 6) if self.completed else 0.0,
+                "max_wait_seconds": round(self.max_wait, 6),
+                "avg_hash_seconds": round(self.total_run / self.completed, 6) if self.completed else 0.0,
+            }
+
+password_hash_pool = PasswordHashPool()
+
+# How long an authenticated user snapshot is reused before the users table is read again
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "30"))
+# Maximum number of user snapshots kept per worker process
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+
+class UserCache:
+    """
+    Short-lived LRU of active users for get_current_user, keyed by user id.
+    Entries hold plain column values (never the password hash) and are handed
+    out as fresh detached User objects, so requests never share an instance.
+    update_user invalidates the entry when it changes is_active or is_admin;
+    other worker processes pick the change up within AUTH_USER_CACHE_TTL.
+    """
+    COLUMNS = ("id", "email", "username", "is_active", "is_admin", "created_at", "updated_at")
+
+    def __init__(self, ttl: float = AUTH_USER_CACHE_TTL, max_size: int = AUTH_USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[uuid.UUID, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: uuid.UUID) -> Optional[User]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            values = entry[1]
+
+        user = User(**values)
+        make_transient_to_detached(user)
+        return user
+
+    def put(self, user: User):
+        if self.ttl <= 0 or not user.is_active:
+            return
+        values = {column: getattr(user, column) for column in self.COLUMNS}
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: uuid.UUID):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "ttl_seconds": self.ttl,
+                "max_size": self.max_size,
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+user_cache = UserCache()
 
 # Token URL (for OAuth2 flow)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
@@ -29,6 +175,14 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password, hashed_password):
+    """verify_password on the password hash pool"""
+    return await password_hash_pool.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """get_password_hash on the password hash pool"""
+    return await password_hash_pool.run(get_password_hash, password)
+
 # User authentication
 def authenticate_user(db: Session, email: str, password: str):
     user = db.query(User).filter(User.email == email).first()
@@ -36,6 +190,14 @@ def authenticate_user(db: Session, email: str, password: str):
         return False
     return user
 
+async def authenticate_user_async(db: AsyncSession, email: str, password: str):
+    """authenticate_user for handlers using an async session; bcrypt runs off the event loop"""
+    result = await db.execute(select(User).filter(User.email == email))
+    user = result.scalars().first()
+    if not user or not await verify_password_async(password, user.hashed_password):
+        return False
+    return user
+
 # JWT token creation
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -76,7 +238,7 @@ def get_token_data(token: str) -> TokenData:
         return None
 
 # Get current user from token
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -101,7 +263,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
         
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+    # Most requests are served from the user cache without touching the database
+    user = user_cache.get(token_data.user_id)
+    if user is not None:
+        return user
+    
+    user = await db.get(User, token_data.user_id)
     if user is None:
         raise credentials_exception
         
@@ -110,7 +277,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Inactive user"
         )
-        
+    
+    user_cache.put(user)
     return user
 
 # Get current active user (for protected routes)
@@ -0,0 +1,203 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import select, update, func, or_, bindparam
+from typing import Dict, Iterable
+import asyncio
+import logging
+import os
+import threading
+import uuid
+
+from ..models.model import Post, Like, Repost, UserProfile, Follower
+from .database import async_engine
+
+logger = logging.getLogger(__name__)
+
+# Buffer like/repost count changes in memory and write them in batches
+COUNTER_BUFFER_ENABLED = os.getenv("COUNTER_BUFFER_ENABLED", "false").lower() in ("true", "1", "yes")
+# How often buffered counter changes are written to the posts table
+COUNTER_FLUSH_INTERVAL_MS = int(os.getenv("COUNTER_FLUSH_INTERVAL_MS", "250"))
+
+BUFFERED_COUNTERS = ("like_count", "repost_count")
+
+class CounterBuffer:
+    """
+    Write-behind buffer for post like and repost counts.
+    Instead of every like taking the post row lock with its own UPDATE, the
+    change is added to a per-post delta in memory and a flusher task writes
+    all pending deltas every COUNTER_FLUSH_INTERVAL_MS in one batched UPDATE.
+    Read paths add this worker's deltas that are not in the database yet.
+    This is best effort: a row read just after a flush commits, while its
+    deltas are still marked in flight, counts them twice, and changes
+    buffered in other workers are not seen until they flush. Counts can be
+    off by up to one interval's changes and settle on the next read.
+    Deltas are per worker process; a crash loses at most one interval of
+    changes, which reconcile_counters repairs.
+    """
+
+    def __init__(self, enabled: bool = COUNTER_BUFFER_ENABLED, interval_ms: int = COUNTER_FLUSH_INTERVAL_MS):
+        self.enabled = enabled
+        self.interval = interval_ms / 1000
+        self._lock = threading.Lock()
+        # Deltas waiting for the next flush
+        self._pending: Dict[uuid.UUID, Dict[str, int]] = {}
+        # Deltas being written by the current flush
+        self._in_flight: Dict[uuid.UUID, Dict[str, int]] = {}
+        self._task = None
+        self._stopping = None
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.flush_errors = 0
+
+    def add(self, post_id: uuid.UUID, counter: str, delta: int):
+        """Record a change to a post counter. Call after the like/repost row is committed."""
+        with self._lock:
+            deltas = self._pending.setdefault(post_id, dict.fromkeys(BUFFERED_COUNTERS, 0))
+            deltas[counter] += delta
+
+    def pending_delta(self, post_id: uuid.UUID, counter: str) -> int:
+        with self._lock:
+            return (self._pending.get(post_id, {}).get(counter, 0)
+                    + self._in_flight.get(post_id, {}).get(counter, 0))
+
+    def merge_pending(self, posts: Iterable[Post]):
+        """
+        Add unflushed deltas to loaded posts without marking them dirty,
+        so the adjusted counts are never written back by the session.
+        The result is approximate around a flush, see CounterBuffer.
+        """
+        if not self.enabled:
+            return
+        for post in posts:
+            if post is None:
+                continue
+            for counter in BUFFERED_COUNTERS:
+                delta = self.pending_delta(post.id, counter)
+                if delta:
+                    set_committed_value(post, counter, (getattr(post, counter) or 0) + delta)
+
+    async def flush(self):
+        """Write all pending deltas with one executemany UPDATE"""
+        with self._lock:
+            if not self._pending or self._in_flight:
+                return
+            self._in_flight, self._pending = self._pending, {}
+            batch = self._in_flight
+
+        # Update rows in a fixed order so concurrent flushes from other workers cannot deadlock
+        rows = [
+            {"b_post_id": post_id, "b_like_delta": deltas["like_count"], "b_repost_delta": deltas["repost_count"]}
+            for post_id, deltas in sorted(batch.items(), key=lambda item: str(item[0]))
+            if any(deltas.values())
+        ]
+
+        posts = Post.__table__
+        statement = update(posts).where(
+            posts.c.id == bindparam("b_post_id")
+        ).values(
+            like_count=posts.c.like_count + bindparam("b_like_delta"),
+            repost_count=posts.c.repost_count + bindparam("b_repost_delta")
+        )
+
+        try:
+            if rows:
+                async with async_engine.begin() as conn:
+                    await conn.execute(statement, rows)
+            self.flushes += 1
+            self.flushed_rows += len(rows)
+        except Exception as e:
+            # Put the deltas back so the next flush retries them
+            self.flush_errors += 1
+            logger.error(f"Counter flush failed, retrying {len(rows)} posts: {e}")
+            with self._lock:
+                for post_id, deltas in batch.items():
+                    pending = self._pending.setdefault(post_id, dict.fromkeys(BUFFERED_COUNTERS, 0))
+                    for counter, delta in deltas.items():
+                        pending[counter] += delta
+        finally:
+            with self._lock:
+                self._in_flight = {}
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def start(self):
+        """Start the periodic flusher on the running event loop"""
+        if self.enabled and self._task is None:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher after a final flush of whatever is still buffered"""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pending_posts = len(self._pending)
+        return {
+            "enabled": self.enabled,
+            "flush_interval_ms": int(self.interval * 1000),
+            "pending_posts": pending_posts,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "flush_errors": self.flush_errors
+        }
+
+counter_buffer = CounterBuffer()
+
+def reconcile_counters(db: Session) -> dict:
+    """
+    Recompute every denormalized counter from its source table in bulk.
+    Each table is fixed with a single UPDATE that only touches rows whose
+    stored value differs. Returns the number of rows corrected per table.
+    """
+    posts = Post.__table__
+    reply = posts.alias("reply")
+
+    like_count = select(func.count(Like.id)).where(Like.post_id == posts.c.id).scalar_subquery()
+    repost_count = select(func.count(Repost.id)).where(Repost.post_id == posts.c.id).scalar_subquery()
+    reply_count = select(func.count(reply.c.id)).where(reply.c.reply_to_post_id == posts.c.id).scalar_subquery()
+
+    posts_fixed = db.execute(
+        update(posts).values(
+            like_count=like_count,
+            repost_count=repost_count,
+            reply_count=reply_count
+        ).where(
+            or_(
+                posts.c.like_count.is_distinct_from(like_count),
+                posts.c.repost_count.is_distinct_from(repost_count),
+                posts.c.reply_count.is_distinct_from(reply_count)
+            )
+        )
+    ).rowcount
+
+    profiles = UserProfile.__table__
+
+    follower_count = select(func.count(Follower.id)).where(Follower.following_id == profiles.c.user_id).scalar_subquery()
+    following_count = select(func.count(Follower.id)).where(Follower.follower_id == profiles.c.user_id).scalar_subquery()
+
+    profiles_fixed = db.execute(
+        update(profiles).values(
+            follower_count=follower_count,
+            following_count=following_count
+        ).where(
+            or_(
+                profiles.c.follower_count.is_distinct_from(follower_count),
+                profiles.c.following_count.is_distinct_from(following_count)
+            )
+        )
+    ).rowcount
+
+    db.commit()
+
+    return {"posts": posts_fixed, "user_profiles": profiles_fixed}
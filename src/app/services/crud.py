@@ -1,16 +1,55 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, selectinload
 from fastapi import HTTPException, status
 from datetime import datetime
 from typing import List, Optional, Union
 import uuid
-from sqlalchemy import desc
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
 
 from ..models.model import User, UserProfile, Post, PostImage, Like, Repost, MediaFile, ModerationAction
 from ..schemas.schema import UserCreate, ProfileCreate, PostCreate, ReplyCreate, LikeCreate, RepostCreate
-from .auth import get_password_hash
+from .auth import get_password_hash, user_cache
+from .pagination import paginate
+from .timeline import fan_out_post, get_home_timeline_ids
+from .deletion import collect_post_subtree, delete_post_subtree, create_deletion_job
+from .counters import counter_buffer
+
+def _post_load_options():
+    """
+    Loader options for everything PostResponse serializes.
+    Author, reply parent and parent author are joined into the main query and
+    images are fetched with a single SELECT ... IN, so a page of posts costs
+    two queries no matter how many rows it contains.
+    """
+    return (
+        joinedload(Post.author),
+        joinedload(Post.reply_to_post).joinedload(Post.author),
+        selectinload(Post.images),
+    )
+
+def _add_post_images(db: Session, post_id: uuid.UUID, image_urls: List[str]):
+    """Attach images to a post, with the variants of those that were uploaded here"""
+    # Limit to max 9 images
+    image_urls = image_urls[:9]
+    
+    # Variants of images that were uploaded here
+    variants = {
+        media.file_url: media
+        for media in db.query(MediaFile).filter(MediaFile.file_url.in_(image_urls))
+    }
+    
+    for image_url in image_urls:
+        media = variants.get(image_url)
+        db_image = PostImage(
+            post_id=post_id,
+            image_url=image_url,
+            thumbnail_url=media.thumbnail_url if media else None,
+            feed_url=media.feed_url if media else None
+        )
+        db.add(db_image)
 
 # User CRUD operations
-def create_user(db: Session, user_create: UserCreate):
+def create_user(db: Session, user_create: UserCreate, hashed_password: Optional[str] = None):
     # Check if user with this email exists
     db_user = db.query(User).filter(User.email == user_create.email).first()
     if db_user:
@@ -21,8 +60,9 @@ def create_user(db: Session, user_create: UserCreate):
     if db_user:
         raise HTTPException(status_code=400, detail="Username already taken")
     
-    # Create new user with hashed password
-    hashed_password = get_password_hash(user_create.password)
+    # Create new user with hashed password (async callers hash it beforehand, off the event loop)
+    if hashed_password is None:
+        hashed_password = get_password_hash(user_create.password)
     db_user = User(
         email=user_create.email,
         username=user_create.username,
@@ -55,8 +95,8 @@ def get_user_by_id(db: Session, user_id: Union[str, uuid.UUID]):
             raise HTTPException(status_code=400, detail="Invalid user ID format")
     return db.query(User).filter(User.id == user_id).first()
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(User).offset(skip).limit(limit).all()
+def get_users(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    return paginate(db.query(User), User.created_at, User.id, skip=skip, limit=limit, cursor=cursor).all()
 
 def update_user(db: Session, user_id: Union[str, uuid.UUID], is_active: bool = None, is_admin: bool = None):
     if isinstance(user_id, str):
@@ -76,6 +116,8 @@ def update_user(db: Session, user_id: Union[str, uuid.UUID], is_active: bool = N
         db_user.is_admin = is_admin
     
     db.commit()
+    # Bans and role changes take effect on this worker's next request
+    user_cache.invalidate(user_id)
     db.refresh(db_user)
     return db_user
 
@@ -132,18 +174,13 @@ def create_post(db: Session, user_id: Union[str, uuid.UUID], post_create: PostCr
     
     # Add images if provided
     if post_create.image_urls:
-        # Limit to max 9 images
-        image_urls = post_create.image_urls[:9]
-        
-        for image_url in image_urls:
-            db_image = PostImage(
-                post_id=db_post.id,
-                image_url=image_url
-            )
-            db.add(db_image)
-        
-        db.commit()
-        db.refresh(db_post)
+        _add_post_images(db, db_post.id, post_create.image_urls)
+    
+    # Write the post into followers' home timelines
+    fan_out_post(db, db_post)
+    
+    db.commit()
+    db.refresh(db_post)
     
     return db_post
 
@@ -163,8 +200,15 @@ def create_reply(db: Session, user_id: Union[str, uuid.UUID], reply_create: Repl
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid post ID format")
     
-    reply_to_post = db.query(Post).filter(Post.id == reply_to_post_id).first()
+    # Increment reply count on the original post, which also confirms it exists
+    reply_to_post = db.execute(
+        update(Post)
+        .where(Post.id == reply_to_post_id)
+        .values(reply_count=Post.reply_count + 1)
+        .returning(Post.id, Post.author_id)
+    ).first()
     if not reply_to_post:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Post to reply to not found")
     
     # Create new reply post
@@ -176,23 +220,11 @@ def create_reply(db: Session, user_id: Union[str, uuid.UUID], reply_create: Repl
     )
     
     db.add(db_reply)
-    db.commit()
-    db.refresh(db_reply)
+    db.flush()
     
     # Add images if provided
     if reply_create.image_urls:
-        # Limit to max 9 images
-        image_urls = reply_create.image_urls[:9]
-        
-        for image_url in image_urls:
-            db_image = PostImage(
-                post_id=db_reply.id,
-                image_url=image_url
-            )
-            db.add(db_image)
-    
-    # Increment reply count on the original post
-    reply_to_post.reply_count += 1
+        _add_post_images(db, db_reply.id, reply_create.image_urls)
     
     db.commit()
     db.refresh(db_reply)
@@ -209,6 +241,7 @@ def get_post(db: Session, post_id: Union[str, uuid.UUID]):
     post = db.query(Post).filter(Post.id == post_id).first()
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
+    counter_buffer.merge_pending([post])
     return post
 
 def get_post_with_author(db: Session, post_id: Union[str, uuid.UUID]):
@@ -218,66 +251,52 @@ def get_post_with_author(db: Session, post_id: Union[str, uuid.UUID]):
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid post ID format")
     
-    post = db.query(Post).filter(Post.id == post_id).first()
+    # Author, replied-to post and its author are loaded with the post itself
+    post = db.query(Post).options(*_post_load_options()).filter(Post.id == post_id).first()
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Load author info
-    author = db.query(User).filter(User.id == post.author_id).first()
-    post.author = author
-    
-    # If it's a reply, load the replied-to post
-    if post.reply_to_post_id:
-        reply_to_post = db.query(Post).filter(Post.id == post.reply_to_post_id).first()
-        if reply_to_post:
-            reply_to_post_author = db.query(User).filter(User.id == reply_to_post.author_id).first()
-            reply_to_post.author = reply_to_post_author
-            post.reply_to_post = reply_to_post
-    
+    counter_buffer.merge_pending([post])
     return post
 
-def get_feed(db: Session, skip: int = 0, limit: int = 20):
+def get_feed(db: Session, skip: int = 0, limit: int = 20, cursor: Optional[str] = None):
     # Simple feed implementation - just get latest posts
     # In a production app, this would be more complex with personalization
-    posts = db.query(Post).order_by(desc(Post.created_at)).offset(skip).limit(limit).all()
-    
-    # Load authors for all posts
-    for post in posts:
-        post.author = db.query(User).filter(User.id == post.author_id).first()
-        
-        # Load reply info if it's a reply
-        if post.reply_to_post_id:
-            reply_to = db.query(Post).filter(Post.id == post.reply_to_post_id).first()
-            if reply_to:
-                reply_to.author = db.query(User).filter(User.id == reply_to.author_id).first()
-                post.reply_to_post = reply_to
-    
+    query = db.query(Post).options(*_post_load_options())
+    posts = paginate(query, Post.created_at, Post.id, skip=skip, limit=limit, cursor=cursor).all()
+    counter_buffer.merge_pending(posts)
     return posts
 
-def get_user_posts(db: Session, user_id: Union[str, uuid.UUID], skip: int = 0, limit: int = 20):
+def get_home_feed(db: Session, user_id: Union[str, uuid.UUID], skip: int = 0, limit: int = 20, cursor: Optional[str] = None):
     if isinstance(user_id, str):
         try:
             user_id = uuid.UUID(user_id)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid user ID format")
     
-    posts = db.query(Post).filter(Post.author_id == user_id).order_by(desc(Post.created_at)).offset(skip).limit(limit).all()
-    
-    # Load author for all posts
-    user = db.query(User).filter(User.id == user_id).first()
-    for post in posts:
-        post.author = user
-        
-        # Load reply info if it's a reply
-        if post.reply_to_post_id:
-            reply_to = db.query(Post).filter(Post.id == post.reply_to_post_id).first()
-            if reply_to:
-                reply_to.author = db.query(User).filter(User.id == reply_to.author_id).first()
-                post.reply_to_post = reply_to
+    # Posts from followed accounts (fan-out on write, merged with high-follower authors on read)
+    post_ids = get_home_timeline_ids(db, user_id, skip=skip, limit=limit, cursor=cursor)
+    posts_by_id = {
+        post.id: post
+        for post in db.query(Post).options(*_post_load_options()).filter(Post.id.in_(post_ids))
+    }
+    posts = [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+    counter_buffer.merge_pending(posts)
+    return posts
+
+def get_user_posts(db: Session, user_id: Union[str, uuid.UUID], skip: int = 0, limit: int = 20, cursor: Optional[str] = None):
+    if isinstance(user_id, str):
+        try:
+            user_id = uuid.UUID(user_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid user ID format")
     
+    query = db.query(Post).options(*_post_load_options()).filter(Post.author_id == user_id)
+    posts = paginate(query, Post.created_at, Post.id, skip=skip, limit=limit, cursor=cursor).all()
+    counter_buffer.merge_pending(posts)
     return posts
 
-def get_post_replies(db: Session, post_id: Union[str, uuid.UUID], skip: int = 0, limit: int = 20):
+def get_post_replies(db: Session, post_id: Union[str, uuid.UUID], skip: int = 0, limit: int = 20, cursor: Optional[str] = None):
     if isinstance(post_id, str):
         try:
             post_id = uuid.UUID(post_id)
@@ -289,18 +308,13 @@ def get_post_replies(db: Session, post_id: Union[str, uuid.UUID], skip: int = 0,
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Get replies
-    replies = db.query(Post).filter(Post.reply_to_post_id == post_id).order_by(desc(Post.created_at)).offset(skip).limit(limit).all()
-    
-    # Load authors for all replies
-    for reply in replies:
-        reply.author = db.query(User).filter(User.id == reply.author_id).first()
-        reply.reply_to_post = post
-        post.author = db.query(User).filter(User.id == post.author_id).first()
-    
-    return replies
+    # Get replies; the parent post and its author come from the identity map / joined load
+    query = db.query(Post).options(*_post_load_options()).filter(Post.reply_to_post_id == post_id)
+    posts = paginate(query, Post.created_at, Post.id, skip=skip, limit=limit, cursor=cursor).all()
+    counter_buffer.merge_pending(posts)
+    return posts
 
-def delete_post(db: Session, post_id: Union[str, uuid.UUID], user_id: Union[str, uuid.UUID], is_admin: bool = False):
+def delete_post(db: Session, post_id: Union[str, uuid.UUID], user_id: Union[str, uuid.UUID], is_admin: bool = False, background: bool = False):
     if isinstance(post_id, str):
         try:
             post_id = uuid.UUID(post_id)
@@ -321,27 +335,16 @@ def delete_post(db: Session, post_id: Union[str, uuid.UUID], user_id: Union[str,
     if post.author_id != user_id and not is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to delete this post")
     
-    # If this is a reply, decrement reply count on parent post
-    if post.reply_to_post_id:
-        parent_post = db.query(Post).filter(Post.id == post.reply_to_post_id).first()
-        if parent_post:
-            parent_post.reply_count = max(0, parent_post.reply_count - 1)
+    # Large reply trees can be removed by a background job that reports progress;
+    # a reply's parent count is decremented when the job removes the reply
+    if background:
+        job = create_deletion_job(post_id, user_id)
+        return {"message": "Post deletion started", "job_id": job["id"]}
     
-    # Delete images associated with post
-    db.query(PostImage).filter(PostImage.post_id == post_id).delete()
-    
-    # Delete likes and reposts
-    db.query(Like).filter(Like.post_id == post_id).delete()
-    db.query(Repost).filter(Repost.post_id == post_id).delete()
-    
-    # Delete replies to this post
-    replies = db.query(Post).filter(Post.reply_to_post_id == post_id).all()
-    for reply in replies:
-        # Recursively delete replies (without checking auth since parent is being deleted)
-        delete_post(db, reply.id, user_id, is_admin=True)
-    
-    # Delete post
-    db.delete(post)
+    # Delete the post and all nested replies, leaves first, in bulk statements,
+    # and decrement the reply count on the parent post of a reply
+    post_ids = collect_post_subtree(db, post_id)
+    delete_post_subtree(db, post_ids, reply_to_post_id=post.reply_to_post_id)
     db.commit()
     
     return {"message": "Post deleted successfully"}
@@ -360,24 +363,38 @@ def create_like(db: Session, user_id: Union[str, uuid.UUID], post_id: Union[str,
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid post ID format")
     
-    # Check if post exists
-    post = db.query(Post).filter(Post.id == post_id).first()
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    
     # Check if user already liked this post
     existing_like = db.query(Like).filter(Like.user_id == user_id, Like.post_id == post_id).first()
     if existing_like:
         return existing_like  # User already liked this post
     
+    if counter_buffer.enabled:
+        # The count is written later by the counter buffer, so only check the post exists
+        updated = db.query(Post.id).filter(Post.id == post_id).first()
+    else:
+        # Update post like count in place, which also confirms the post exists
+        updated = db.execute(
+            update(Post)
+            .where(Post.id == post_id)
+            .values(like_count=Post.like_count + 1)
+            .returning(Post.id)
+        ).first()
+    if not updated:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Post not found")
+    
     # Create like
     db_like = Like(user_id=user_id, post_id=post_id)
     db.add(db_like)
     
-    # Update post like count
-    post.like_count += 1
-    
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request liked the post first; its increment is the one that counts
+        db.rollback()
+        return db.query(Like).filter(Like.user_id == user_id, Like.post_id == post_id).first()
+    if counter_buffer.enabled:
+        counter_buffer.add(post_id, "like_count", 1)
     db.refresh(db_like)
     
     return db_like
@@ -395,19 +412,22 @@ def delete_like(db: Session, user_id: Union[str, uuid.UUID], post_id: Union[str,
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid post ID format")
     
-    # Find like
-    like = db.query(Like).filter(Like.user_id == user_id, Like.post_id == post_id).first()
-    if not like:
+    # Delete like
+    deleted = db.query(Like).filter(Like.user_id == user_id, Like.post_id == post_id).delete(synchronize_session=False)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Like not found")
     
-    # Get post to update count
-    post = db.query(Post).filter(Post.id == post_id).first()
-    if post:
-        post.like_count = max(0, post.like_count - 1)  # Ensure it doesn't go below zero
-    
-    # Delete like
-    db.delete(like)
-    db.commit()
+    if counter_buffer.enabled:
+        db.commit()
+        counter_buffer.add(post_id, "like_count", -1)
+    else:
+        # Update post like count in place, never going below zero
+        db.execute(
+            update(Post)
+            .where(Post.id == post_id, Post.like_count > 0)
+            .values(like_count=Post.like_count - 1)
+        )
+        db.commit()
     
     return {"message": "Like removed successfully"}
 
@@ -424,16 +444,26 @@ def create_repost(db: Session, user_id: Union[str, uuid.UUID], post_id: Union[st
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid post ID format")
     
-    # Check if post exists
-    post = db.query(Post).filter(Post.id == post_id).first()
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    
     # Check if user already reposted this post
     existing_repost = db.query(Repost).filter(Repost.user_id == user_id, Repost.post_id == post_id).first()
     if existing_repost:
         return existing_repost  # User already reposted this post
     
+    if counter_buffer.enabled:
+        # The count is written later by the counter buffer, so only read the original
+        post = db.query(Post.content).filter(Post.id == post_id).first()
+    else:
+        # Update original post repost count in place, which also confirms it exists
+        post = db.execute(
+            update(Post)
+            .where(Post.id == post_id)
+            .values(repost_count=Post.repost_count + 1)
+            .returning(Post.content)
+        ).first()
+    if not post:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Post not found")
+    
     # Create repost record
     db_repost = Repost(user_id=user_id, post_id=post_id)
     db.add(db_repost)
@@ -446,10 +476,19 @@ def create_repost(db: Session, user_id: Union[str, uuid.UUID], post_id: Union[st
     )
     db.add(db_repost_post)
     
-    # Update original post repost count
-    post.repost_count += 1
+    try:
+        db.flush()
+    except IntegrityError:
+        # A concurrent request reposted first; its increment is the one that counts
+        db.rollback()
+        return db.query(Repost).filter(Repost.user_id == user_id, Repost.post_id == post_id).first()
+    
+    # Write the repost into followers' home timelines
+    fan_out_post(db, db_repost_post)
     
     db.commit()
+    if counter_buffer.enabled:
+        counter_buffer.add(post_id, "repost_count", 1)
     db.refresh(db_repost)
     
     return db_repost
@@ -461,7 +500,11 @@ def create_media_file(db: Session,
                      file_path: str, 
                      file_url: str, 
                      mime_type: str, 
-                     file_size: int):
+                     file_size: int,
+                     thumbnail_url: Optional[str] = None,
+                     feed_url: Optional[str] = None,
+                     original_size: Optional[int] = None,
+                     content_hash: Optional[str] = None):
     
     if isinstance(user_id, str):
         try:
@@ -473,8 +516,12 @@ def create_media_file(db: Session,
         filename=filename,
         file_path=file_path,
         file_url=file_url,
+        thumbnail_url=thumbnail_url,
+        feed_url=feed_url,
         mime_type=mime_type,
         file_size=file_size,
+        original_size=original_size,
+        content_hash=content_hash,
         uploader_id=user_id
     )
     
@@ -484,6 +531,98 @@ def create_media_file(db: Session,
     
     return db_media
 
+def create_media_files(db: Session, user_id: Union[str, uuid.UUID], file_infos: List[dict]):
+    """Record the stored files of an upload batch in one transaction and one batched INSERT"""
+    if isinstance(user_id, str):
+        try:
+            user_id = uuid.UUID(user_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid user ID format")
+    
+    db_media_files = [
+        MediaFile(
+            filename=file_info["filename"],
+            file_path=file_info["file_path"],
+            file_url=file_info["file_url"],
+            thumbnail_url=file_info.get("thumbnail_url"),
+            feed_url=file_info.get("feed_url"),
+            mime_type=file_info["mime_type"],
+            file_size=file_info["file_size"],
+            original_size=file_info.get("original_size"),
+            content_hash=file_info.get("content_hash"),
+            uploader_id=user_id
+        )
+        for file_info in file_infos
+    ]
+    
+    db.add_all(db_media_files)
+    db.commit()
+    
+    return db_media_files
+
+def delete_media_file(db: Session, media_id: Union[str, uuid.UUID], user_id: Union[str, uuid.UUID]) -> MediaFile:
+    """
+    Delete an upload record and return it. Records with the same content share
+    their stored files, so the caller removes them only when no longer used.
+    """
+    if isinstance(media_id, str):
+        try:
+            media_id = uuid.UUID(media_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid media ID format")
+    
+    if isinstance(user_id, str):
+        try:
+            user_id = uuid.UUID(user_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid user ID format")
+    
+    media = db.query(MediaFile).filter(MediaFile.id == media_id).first()
+    if not media:
+        raise HTTPException(status_code=404, detail="Media file not found")
+    
+    if media.uploader_id != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to delete this media file")
+    
+    # The user's own posts still show this upload
+    attached = db.query(PostImage.id).join(Post, PostImage.post_id == Post.id).filter(
+        PostImage.image_url == media.file_url,
+        Post.author_id == user_id
+    ).first()
+    if attached:
+        raise HTTPException(status_code=409, detail="Media file is attached to a post")
+    
+    db.delete(media)
+    db.commit()
+    
+    return media
+
+def get_media_bandwidth_report(db: Session):
+    """Uploaded vs stored bytes of all media files, in total and per stored type"""
+    # Files stored before sizes were recorded count as unchanged
+    original_size = func.coalesce(MediaFile.original_size, MediaFile.file_size)
+    rows = db.query(
+        MediaFile.mime_type,
+        func.count(MediaFile.id),
+        func.coalesce(func.sum(original_size), 0),
+        func.coalesce(func.sum(MediaFile.file_size), 0)
+    ).group_by(MediaFile.mime_type).order_by(MediaFile.mime_type).all()
+    
+    types = [
+        {"mime_type": mime_type, "files": files, "original_bytes": int(original), "stored_bytes": int(stored)}
+        for mime_type, files, original, stored in rows
+    ]
+    original_bytes = sum(t["original_bytes"] for t in types)
+    stored_bytes = sum(t["stored_bytes"] for t in types)
+    return {
+        "files": sum(t["files"] for t in types),
+        "original_bytes": original_bytes,
+        "stored_bytes": stored_bytes,
+        "saved_bytes": original_bytes - stored_bytes,
+        "saved_ratio": round(1 - stored_bytes / original_bytes, 4) if original_bytes else 0.0,
+        "types": types
+    }
+
 # Admin operations
 def create_moderation_action(db: Session, 
                             admin_id: Union[str, uuid.UUID], 
@@ -524,5 +663,6 @@ def create_moderation_action(db: Session,
     
     return db_action
 
-def get_moderation_actions(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(ModerationAction).order_by(desc(ModerationAction.created_at)).offset(skip).limit(limit).all()
+def get_moderation_actions(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    query = db.query(ModerationAction)
+    return paginate(query, ModerationAction.created_at, ModerationAction.id, skip=skip, limit=limit, cursor=cursor).all()
@@ -0,0 +1,52 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from functools import wraps
+
+from . import crud
+
+def _awaitable(crud_function):
+    """
+    Build an awaitable version of a sync CRUD function.
+    The function runs through AsyncSession.run_sync, so its queries go over the
+    async driver and the event loop stays free while the database works.
+    """
+    @wraps(crud_function)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(crud_function, *args, **kwargs)
+    return wrapper
+
+# User CRUD operations
+create_user = _awaitable(crud.create_user)
+get_user_by_email = _awaitable(crud.get_user_by_email)
+get_user_by_id = _awaitable(crud.get_user_by_id)
+get_users = _awaitable(crud.get_users)
+update_user = _awaitable(crud.update_user)
+
+# Profile CRUD operations
+get_profile = _awaitable(crud.get_profile)
+update_profile = _awaitable(crud.update_profile)
+
+# Post CRUD operations
+create_post = _awaitable(crud.create_post)
+create_reply = _awaitable(crud.create_reply)
+get_post = _awaitable(crud.get_post)
+get_post_with_author = _awaitable(crud.get_post_with_author)
+get_feed = _awaitable(crud.get_feed)
+get_home_feed = _awaitable(crud.get_home_feed)
+get_user_posts = _awaitable(crud.get_user_posts)
+get_post_replies = _awaitable(crud.get_post_replies)
+delete_post = _awaitable(crud.delete_post)
+
+# Interaction CRUD operations
+create_like = _awaitable(crud.create_like)
+delete_like = _awaitable(crud.delete_like)
+create_repost = _awaitable(crud.create_repost)
+
+# Media CRUD operations
+create_media_file = _awaitable(crud.create_media_file)
+create_media_files = _awaitable(crud.create_media_files)
+delete_media_file = _awaitable(crud.delete_media_file)
+get_media_bandwidth_report = _awaitable(crud.get_media_bandwidth_report)
+
+# Admin operations
+create_moderation_action = _awaitable(crud.create_moderation_action)
+get_moderation_actions = _awaitable(crud.get_moderation_actions)
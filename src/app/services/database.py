@@ -1,6 +1,8 @@
-from sqlalchemy import create_engine, inspect, text
+from sqlalchemy import create_engine, inspect, text, exc
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 import os
 import sys
 import time
@@ -19,6 +21,78 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.db")
 
 logger.info(f"Connecting to database: {DATABASE_URL}")
 
+# Connection pool settings for PostgreSQL (per worker process). The size and
+# overflow are those of the async engine, which serves every request.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# The sync engine only serves startup, scripts and background deletions
+DB_SYNC_POOL_SIZE = int(os.getenv("DB_SYNC_POOL_SIZE", "2"))
+DB_SYNC_MAX_OVERFLOW = int(os.getenv("DB_SYNC_MAX_OVERFLOW", "0"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+class PoolWaitStats:
+    """Accumulates how long callers waited to check a connection out of a pool"""
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, waited: float, timed_out: bool = False):
+        self.checkouts += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        if timed_out:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "total_wait_seconds": round(self.total_wait, 6),
+            "avg_wait_seconds": round(self.total_wait / self.checkouts, 6) if self.checkouts else 0.0,
+            "max_wait_seconds": round(self.max_wait, 6),
+        }
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records checkout wait time"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # Keep accumulated stats when the engine recreates its pool
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+class TimedAsyncAdaptedQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records checkout wait time"""
+    pass
+
+def get_pool_options(poolclass, pool_size: int, max_overflow: int) -> dict:
+    """Engine keyword arguments for a pooled PostgreSQL engine"""
+    return {
+        "poolclass": poolclass,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
 # Add config for SQLite (using file) or PostgreSQL (using environment variables)
 if DATABASE_URL.startswith("sqlite"):
     engine = create_engine(
@@ -26,11 +100,59 @@ if DATABASE_URL.startswith("sqlite"):
     )
 else:
     # PostgreSQL connection
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, **get_pool_options(TimedQueuePool, DB_SYNC_POOL_SIZE, DB_SYNC_MAX_OVERFLOW))
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def get_async_database_url(database_url: str) -> str:
+    """Map a sync database URL onto its async driver (aiosqlite / asyncpg)"""
+    if database_url.startswith("sqlite:"):
+        return database_url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if database_url.startswith("postgresql+psycopg2:"):
+        return database_url.replace("postgresql+psycopg2:", "postgresql+asyncpg:", 1)
+    if database_url.startswith("postgresql:"):
+        return database_url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    if database_url.startswith("postgres:"):
+        return database_url.replace("postgres:", "postgresql+asyncpg:", 1)
+    return database_url
+
+# Async engine used by the request handlers so queries don't block the event loop.
+# The sync engine above is kept for startup, migrations and the helper scripts.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", get_async_database_url(DATABASE_URL))
+
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, connect_args={"check_same_thread": False}
+    )
+else:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, **get_pool_options(TimedAsyncAdaptedQueuePool, DB_POOL_SIZE, DB_MAX_OVERFLOW)
+    )
+
+# Objects must stay readable after commit: an expired attribute cannot be
+# lazily refreshed once the response is being serialized outside the session
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+def get_pool_snapshot() -> dict:
+    """Current pool usage of the sync and async engines, for sizing workers"""
+    snapshot = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        stats = {"pool_class": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "pool_size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "timeout_seconds": pool.timeout(),
+            })
+        if isinstance(pool, TimedQueuePool):
+            stats.update(pool.wait_stats.snapshot())
+        snapshot[name] = stats
+    return snapshot
+
 # Base class for all models
 Base = declarative_base()
 
@@ -133,8 +255,88 @@ def apply_migrations():
                 else:
                     conn.execute(text("ALTER TABLE user_profiles ADD COLUMN following_count INTEGER DEFAULT 0;"))
     
+    # Add image variant columns to media_files and post_images if they don't exist
+    for table_name in ("media_files", "post_images"):
+        if table_name not in inspector.get_table_names():
+            continue
+        columns = [col["name"] for col in inspector.get_columns(table_name)]
+        with engine.begin() as conn:
+            for column in ("thumbnail_url", "feed_url"):
+                if column not in columns:
+                    logger.info(f"Adding {column} column to {table_name}")
+                    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column} VARCHAR;"))
+    
+    # Add original_size to media_files if it doesn't exist
+    if "media_files" in inspector.get_table_names():
+        columns = [col["name"] for col in inspector.get_columns("media_files")]
+        if "original_size" not in columns:
+            logger.info("Adding original_size column to media_files")
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE media_files ADD COLUMN original_size INTEGER;"))
+        
+        # Add content_hash to media_files if it doesn't exist
+        if "content_hash" not in columns:
+            logger.info("Adding content_hash column to media_files")
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE media_files ADD COLUMN content_hash VARCHAR;"))
+    
+    from ..models.model import TimelineEntry
+    
+    # Create the home timeline table on databases that predate it
+    if "timeline_entries" not in inspector.get_table_names():
+        logger.info("Creating timeline_entries table")
+        TimelineEntry.__table__.create(bind=engine, checkfirst=True)
+        inspector = inspect(engine)
+    
+    # Missing indexes are built by apply_index_migrations(), which runs once
+    # per deployment from migrate_profiles.py rather than in every worker
+    
     logger.info("Database migrations completed")
 
+def apply_index_migrations(metadata):
+    """
+    Create every index declared in metadata that the database is missing.
+    On PostgreSQL the indexes are built with CREATE INDEX CONCURRENTLY so large
+    existing tables stay writable; that statement cannot run inside a
+    transaction, hence the autocommit connection.
+    Run it from a single process (the migrate script), never from every
+    worker: a concurrent build in progress looks like an invalid index.
+    """
+    inspector = inspect(engine)
+    existing_tables = inspector.get_table_names()
+    is_postgres = DATABASE_URL.startswith("postgresql")
+    declared_indexes = [index.name for table in metadata.sorted_tables for index in table.indexes]
+    
+    invalid_indexes = []
+    
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if is_postgres and declared_indexes:
+            # A concurrent build that failed leaves an INVALID index behind; drop it so it is rebuilt.
+            # Only indexes declared on the models and visible on the search path are touched.
+            invalid_indexes = conn.execute(text(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE NOT i.indisvalid AND pg_table_is_visible(c.oid) AND c.relname = ANY(:names)"
+            ), {"names": declared_indexes}).scalars().all()
+            for index_name in invalid_indexes:
+                logger.warning(f"Dropping invalid index {index_name}")
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}"'))
+        
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)} - set(invalid_indexes)
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                
+                logger.info(f"Creating index {index.name} on {table.name}")
+                columns = ", ".join(f'"{column.name}"' for column in index.columns)
+                unique = "UNIQUE " if index.unique else ""
+                concurrently = "CONCURRENTLY " if is_postgres else ""
+                conn.execute(text(
+                    f'CREATE {unique}INDEX {concurrently}IF NOT EXISTS "{index.name}" ON "{table.name}" ({columns})'
+                ))
+
 # Dependency to get DB session
 def get_db():
     """Dependency to get a database session."""
@@ -142,4 +344,10 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+# Dependency to get an async DB session
+async def get_async_db():
+    """Dependency to get an async database session."""
+    async with AsyncSessionLocal() as db:
+        yield db 
\ No newline at end of file
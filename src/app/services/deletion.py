@@ -0,0 +1,133 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, literal, desc, update
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+import logging
+import os
+import uuid
+
+from ..models.model import Post, PostImage, Like, Repost, TimelineEntry
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Number of posts removed per batch of DELETE statements
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "500"))
+
+# Progress of background deletions, keyed by job id (per worker process)
+deletion_jobs: Dict[str, dict] = {}
+# How long finished jobs stay queryable
+DELETION_JOB_TTL = timedelta(hours=1)
+
+def collect_post_subtree(db: Session, post_id: uuid.UUID) -> List[uuid.UUID]:
+    """
+    Return the ids of a post and all its nested replies with one recursive CTE.
+    Deepest replies come first so batches can be deleted leaves-first without
+    breaking the reply_to_post_id foreign key.
+    """
+    subtree = select(
+        Post.id, literal(0).label("depth")
+    ).filter(Post.id == post_id).cte("post_subtree", recursive=True)
+
+    subtree = subtree.union_all(
+        select(Post.id, subtree.c.depth + 1).filter(Post.reply_to_post_id == subtree.c.id)
+    )
+
+    return db.execute(select(subtree.c.id).order_by(desc(subtree.c.depth))).scalars().all()
+
+def delete_post_batch(db: Session, post_ids: List[uuid.UUID]):
+    """Delete a batch of posts and everything attached to them in bulk statements"""
+    db.query(PostImage).filter(PostImage.post_id.in_(post_ids)).delete(synchronize_session=False)
+    db.query(Like).filter(Like.post_id.in_(post_ids)).delete(synchronize_session=False)
+    db.query(Repost).filter(Repost.post_id.in_(post_ids)).delete(synchronize_session=False)
+    db.query(TimelineEntry).filter(TimelineEntry.post_id.in_(post_ids)).delete(synchronize_session=False)
+    # Reposts of deleted posts stay, without their original (as the ORM delete left them)
+    db.execute(
+        update(Post)
+        .where(Post.original_post_id.in_(post_ids))
+        .values(original_post_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.query(Post).filter(Post.id.in_(post_ids)).delete(synchronize_session=False)
+
+def delete_post_subtree(
+    db: Session,
+    post_ids: List[uuid.UUID],
+    commit_each_batch: bool = False,
+    on_progress: Optional[Callable[[int], None]] = None,
+    reply_to_post_id: Optional[uuid.UUID] = None
+):
+    """
+    Delete the given posts in batches of DELETE_BATCH_SIZE.
+    With commit_each_batch every batch is its own short transaction, so a huge
+    reply tree does not hold one long transaction open.
+    When the subtree is a reply, pass the post it replies to: its reply count
+    is decremented in the same transaction as the last batch, which removes
+    the reply itself, so a failed deletion leaves the count alone.
+    """
+    deleted = 0
+    for start in range(0, len(post_ids), DELETE_BATCH_SIZE):
+        batch = post_ids[start:start + DELETE_BATCH_SIZE]
+        if reply_to_post_id and start + DELETE_BATCH_SIZE >= len(post_ids):
+            db.execute(
+                update(Post)
+                .where(Post.id == reply_to_post_id, Post.reply_count > 0)
+                .values(reply_count=Post.reply_count - 1)
+            )
+        delete_post_batch(db, batch)
+        if commit_each_batch:
+            db.commit()
+        deleted += len(batch)
+        if on_progress:
+            on_progress(deleted)
+
+def create_deletion_job(post_id: uuid.UUID, requested_by: uuid.UUID) -> dict:
+    """Register a pending background deletion and return its progress record"""
+    # Forget jobs that finished a while ago
+    now = datetime.utcnow()
+    for job_id in [job_id for job_id, job in deletion_jobs.items()
+                   if job["finished_at"] and now - job["finished_at"] > DELETION_JOB_TTL]:
+        del deletion_jobs[job_id]
+    
+    job = {
+        "id": str(uuid.uuid4()),
+        "post_id": post_id,
+        "requested_by": requested_by,
+        "status": "pending",
+        "total": 0,
+        "deleted": 0,
+        "error": None,
+        "created_at": datetime.utcnow(),
+        "finished_at": None
+    }
+    deletion_jobs[job["id"]] = job
+    return job
+
+def get_deletion_job(job_id: str) -> Optional[dict]:
+    return deletion_jobs.get(job_id)
+
+def run_deletion_job(job_id: str):
+    """Background task: delete a post subtree in committed batches, updating job progress"""
+    job = deletion_jobs[job_id]
+    job["status"] = "running"
+
+    db = SessionLocal()
+    try:
+        reply_to_post_id = db.query(Post.reply_to_post_id).filter(Post.id == job["post_id"]).scalar()
+        post_ids = collect_post_subtree(db, job["post_id"])
+        job["total"] = len(post_ids)
+
+        def on_progress(deleted: int):
+            job["deleted"] = deleted
+
+        delete_post_subtree(db, post_ids, commit_each_batch=True, on_progress=on_progress,
+                            reply_to_post_id=reply_to_post_id)
+        job["status"] = "completed"
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Deletion job {job_id} failed: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.utcnow()
+        db.close()
@@ -1,14 +1,28 @@
+import io
 import os
-import shutil
-import uuid
-from fastapi import UploadFile, HTTPException
-from typing import List
+import asyncio
+import hashlib
+import logging
 import mimetypes
-from PIL import Image
-import io
+import tempfile
+import weakref
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import UploadFile, HTTPException
+from typing import BinaryIO, Dict, List, Optional
+from PIL import Image, ImageOps, features
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal, async_engine
+from ..models.model import MediaFile
+
+logger = logging.getLogger(__name__)
 
 # Base directory for file storage
 MEDIA_DIR = os.environ.get("MEDIA_DIR", "static/media")
+# Uploads are stored once per distinct content, named after its SHA-256 hash
+BLOB_DIR = os.path.join(MEDIA_DIR, "blobs")
 # Maximum file size in bytes (5MB)
 MAX_FILE_SIZE = 5 * 1024 * 1024
 # Allowed image mime types
@@ -18,48 +32,166 @@ ALLOWED_MIME_TYPES = [
     "image/gif", 
     "image/webp"
 ]
+# Bytes read from an upload and written to disk at a time
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+# Uploads streamed, hashed and verified at once per worker
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Maximum number of images in one batch (one post)
+MAX_FILES_PER_BATCH = 9
+
+# Hashing, file I/O and most of PIL's decoding release the GIL, so threads
+# process the images of a batch in parallel; the bound keeps a burst of
+# uploads from starving the rest of the worker
+media_executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+
+# Widths of the downscaled copies made of every upload; the original serves as "full"
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", "320"))
+FEED_IMAGE_WIDTH = int(os.getenv("FEED_IMAGE_WIDTH", "1080"))
+IMAGE_VARIANTS = {"thumbnail": THUMBNAIL_WIDTH, "feed": FEED_IMAGE_WIDTH}
+
+# Re-encode uploads into modern formats, keeping the smallest result
+MEDIA_TRANSCODE_ENABLED = os.getenv("MEDIA_TRANSCODE_ENABLED", "false").lower() in ("true", "1", "yes")
+# Formats to try; ones this Pillow build cannot write are skipped
+MEDIA_TRANSCODE_FORMATS = os.getenv("MEDIA_TRANSCODE_FORMATS", "webp,avif")
+# Encoder quality of transcoded images (0-100)
+MEDIA_TRANSCODE_QUALITY = int(os.getenv("MEDIA_TRANSCODE_QUALITY", "80"))
+
+# Pillow format, mime type and extension of each transcoding target
+TRANSCODE_TARGETS = {
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "avif": ("AVIF", "image/avif", ".avif"),
+}
+
+# Not every Python knows the type, and static files are served by extension
+mimetypes.add_type("image/avif", ".avif")
+
+def supported_transcode_formats(formats: str) -> List[str]:
+    """The configured transcoding formats this Pillow build can write"""
+    supported = []
+    for name in (f.strip().lower() for f in formats.split(",")):
+        if name not in TRANSCODE_TARGETS:
+            continue
+        try:
+            if features.check(name):
+                supported.append(name)
+        except ValueError:
+            # Feature unknown to this (older) Pillow
+            pass
+    return supported
+
+TRANSCODE_FORMATS = supported_transcode_formats(MEDIA_TRANSCODE_FORMATS) if MEDIA_TRANSCODE_ENABLED else []
+
+# Resizing is CPU-bound pixel work that holds the GIL, so it runs in worker
+# processes, created on first use
+_variant_pool: Optional[ProcessPoolExecutor] = None
+
+def get_variant_pool() -> ProcessPoolExecutor:
+    global _variant_pool
+    if _variant_pool is None:
+        _variant_pool = ProcessPoolExecutor(max_workers=MEDIA_WORKERS)
+    return _variant_pool
+
+def shutdown_variant_pool():
+    global _variant_pool
+    if _variant_pool is not None:
+        _variant_pool.shutdown(wait=True)
+        _variant_pool = None
+
+# Leading bytes of the allowed image types (WebP is checked separately)
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+# Extension a stored image gets for each sniffed type
+IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
 
 def ensure_media_dir():
     """Ensure media directory exists"""
     if not os.path.exists(MEDIA_DIR):
         os.makedirs(MEDIA_DIR, exist_ok=True)
     
-    # Create user uploads directory
+    # Create user uploads directory (files stored before content addressing)
     user_uploads_dir = os.path.join(MEDIA_DIR, "uploads")
     if not os.path.exists(user_uploads_dir):
         os.makedirs(user_uploads_dir, exist_ok=True)
     
-    return user_uploads_dir
+    # Create content-addressed storage directory
+    if not os.path.exists(BLOB_DIR):
+        os.makedirs(BLOB_DIR, exist_ok=True)
+    
+    return BLOB_DIR
 
 def get_file_extension(filename: str) -> str:
     """Get file extension from filename"""
     return os.path.splitext(filename)[1].lower() if filename else ""
 
-def validate_image_file(file: UploadFile) -> bool:
-    """Validate image file size and type"""
-    # Check file size by reading content (may be slow for large files)
-    file.file.seek(0, 2)  # Go to end of file
-    file_size = file.file.tell()  # Get file size
-    file.file.seek(0)  # Reset file position
-    
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE} bytes")
-    
-    # Check file content type
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """Detect the image type from the first bytes of a file"""
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+def validate_content_type(file: UploadFile):
+    """Reject uploads whose declared type is not an allowed image type"""
     content_type = file.content_type
     if content_type not in ALLOWED_MIME_TYPES:
         raise HTTPException(status_code=400, detail=f"File type {content_type} not allowed. Allowed types: {ALLOWED_MIME_TYPES}")
+
+def stream_to_temp_file(source: BinaryIO, directory: str) -> dict:
+    """
+    Copy an upload into a temporary file in `directory` one chunk at a time,
+    hashing it on the way. The image type is sniffed from the first chunk and
+    the size limit is checked after every chunk, so a bad upload is rejected
+    without reading the rest of it. Only one chunk is held in memory.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    mime_type = None
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if mime_type is None:
+                    mime_type = sniff_image_type(chunk)
+                    if mime_type is None:
+                        raise HTTPException(status_code=400, detail="Invalid image file: unrecognized image format")
+                size += len(chunk)
+                if size > MAX_FILE_SIZE:
+                    raise HTTPException(status_code=400, detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE} bytes")
+                digest.update(chunk)
+                buffer.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Invalid image file: empty file")
+    except BaseException:
+        os.unlink(temp_path)
+        raise
     
-    # Additional validation: try opening as image
+    return {
+        "temp_path": temp_path,
+        "mime_type": mime_type,
+        "file_size": size,
+        "content_hash": digest.hexdigest()
+    }
+
+def validate_image_file(file_path: str) -> bool:
+    """Validate the integrity of an image stored on disk"""
     try:
-        image_data = file.file.read()
-        file.file.seek(0)  # Reset file position after reading
-        
-        img = Image.open(io.BytesIO(image_data))
-        img.verify()  # Verify image integrity
-        
-        # Re-open to check dimensions/metadata
-        img = Image.open(io.BytesIO(image_data))
+        # PIL reads the file itself, so the image is never loaded into memory twice
+        with Image.open(file_path) as img:
+            img.verify()
         
         # Additional image validation could be done here
         # e.g. check dimensions, aspect ratio, etc.
@@ -68,62 +200,377 @@ def validate_image_file(file: UploadFile) -> bool:
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
 
-def generate_unique_filename(original_filename: str) -> str:
-    """Generate a unique filename to avoid collisions"""
-    extension = get_file_extension(original_filename)
-    return f"{uuid.uuid4().hex}{extension}"
+def stage_upload(source: BinaryIO, directory: str) -> dict:
+    """
+    Stream an upload into a temporary file in `directory` and verify it.
+    The caller moves it to its content-addressed name, or drops it when the
+    content is already stored. Blocking; run it off the event loop.
+    """
+    info = stream_to_temp_file(source, directory)
+    try:
+        validate_image_file(info["temp_path"])
+    except BaseException:
+        os.unlink(info["temp_path"])
+        raise
+    return info
 
-async def save_upload_file(file: UploadFile, user_id: int) -> dict:
+def transcode_image(file_path: str, formats: List[str], quality: int) -> Optional[dict]:
     """
-    Save an uploaded file to the media directory
-    Returns file info for database storage
+    Re-encode a stored image into each of `formats` and replace it with the
+    smallest result, without EXIF metadata. The original is kept when it is
+    smaller and has no EXIF to strip, and for animated images; None is
+    returned then. Runs in a worker process.
     """
-    # Ensure media directory exists
-    user_uploads_dir = ensure_media_dir()
+    original_size = os.path.getsize(file_path)
+    with Image.open(file_path) as original:
+        if getattr(original, "is_animated", False):
+            return None
+        has_exif = len(original.getexif()) > 0
+        icc_profile = original.info.get("icc_profile")
+        
+        # Bake the orientation in, as the EXIF tag carrying it is dropped
+        img = ImageOps.exif_transpose(original)
+        if img.mode not in ("RGB", "RGBA"):
+            transparent = img.mode in ("LA", "PA") or "transparency" in img.info
+            img = img.convert("RGBA" if transparent else "RGB")
+        
+        best = None
+        for name in formats:
+            image_format, mime_type, extension = TRANSCODE_TARGETS[name]
+            buffer = io.BytesIO()
+            # No exif argument, so the metadata is not copied; the color profile is
+            options = {"icc_profile": icc_profile} if icc_profile else {}
+            img.save(buffer, image_format, quality=quality, **options)
+            if best is None or buffer.tell() < len(best[0]):
+                best = (buffer.getvalue(), mime_type, extension)
+    
+    if best is None:
+        return None
+    data, mime_type, extension = best
+    if len(data) >= original_size and not has_exif:
+        return None
     
-    # Validate file
-    validate_image_file(file)
+    new_path = os.path.splitext(file_path)[0] + extension
+    temp_path = f"{new_path}.part"
+    with open(temp_path, "wb") as buffer:
+        buffer.write(data)
+    os.replace(temp_path, new_path)
+    if new_path != file_path:
+        os.remove(file_path)
+    
+    return {
+        "file_path": new_path,
+        "mime_type": mime_type,
+        "file_size": len(data)
+    }
+
+def generate_variants(file_path: str, widths: Dict[str, int]) -> Dict[str, str]:
+    """
+    Write downscaled copies of an image next to it as <name>_<variant><ext>
+    and return their paths by variant name. No copy is made for widths the
+    original does not exceed, or of animated images; the original serves
+    those. Runs in a worker process.
+    """
+    variants = {}
+    with Image.open(file_path) as original:
+        image_format = original.format
+        if getattr(original, "is_animated", False):
+            return variants
+        
+        # Bake the EXIF orientation in, as the copies are served without it
+        img = ImageOps.exif_transpose(original)
+        if img.mode == "P":
+            img = img.convert("RGBA")
+        
+        stem, extension = os.path.splitext(file_path)
+        for name, width in widths.items():
+            if width <= 0 or width >= img.width:
+                continue
+            height = max(1, round(img.height * width / img.width))
+            resized = img.resize((width, height), Image.LANCZOS)
+            
+            variant_path = f"{stem}_{name}{extension}"
+            temp_path = f"{variant_path}.part"
+            resized.save(temp_path, image_format, quality=85, optimize=True)
+            os.replace(temp_path, variant_path)
+            variants[name] = variant_path
     
-    # Create user directory if it doesn't exist
-    user_dir = os.path.join(user_uploads_dir, str(user_id))
-    if not os.path.exists(user_dir):
-        os.makedirs(user_dir, exist_ok=True)
+    return variants
+
+def blob_url(file_path: str) -> str:
+    """URL of a file in content-addressed storage"""
+    shard = os.path.basename(os.path.dirname(file_path))
+    return f"/static/media/blobs/{shard}/{os.path.basename(file_path)}"
+
+def _stored_paths(file_path: str, file_url: str, variant_urls) -> List[str]:
+    directory = os.path.dirname(file_path)
+    paths = [file_path]
+    for url in variant_urls:
+        if url and url != file_url:
+            paths.append(os.path.join(directory, os.path.basename(url)))
+    return paths
+
+def stored_file_paths(media: MediaFile) -> List[str]:
+    """The stored file of a MediaFile record and its variants"""
+    return _stored_paths(media.file_path, media.file_url, (media.thumbnail_url, media.feed_url))
+
+def remove_stored_files(paths: List[str]):
+    """Remove stored files that nothing references any more"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+# Other workers share the stored files, so on PostgreSQL every request that
+# saves a blob holds a shared advisory lock on its hash until its record is
+# committed, and removing a blob takes the lock exclusively
+_BLOB_LOCK_SQL = {
+    "shared": text("SELECT pg_advisory_xact_lock_shared(hashtext(:content_hash))"),
+    "exclusive": text("SELECT pg_advisory_xact_lock(hashtext(:content_hash))"),
+}
+
+async def lock_blobs(db: AsyncSession, content_hashes: List[str], mode: str = "shared"):
+    """
+    Take the advisory locks of blobs in the current transaction of `db`,
+    in a fixed order so requests locking several blobs cannot deadlock.
+    Other databases run a single worker and only use the in-process locks.
+    """
+    if async_engine.dialect.name != "postgresql":
+        return
+    for content_hash in sorted(set(content_hashes)):
+        await db.execute(_BLOB_LOCK_SQL[mode], {"content_hash": content_hash})
+
+# One lock per content hash, so identical files uploaded together are
+# processed once and never removed while another request decides to reuse them
+_blob_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def blob_lock(content_hash: str) -> asyncio.Lock:
+    lock = _blob_locks.get(content_hash)
+    if lock is None:
+        lock = asyncio.Lock()
+        _blob_locks[content_hash] = lock
+    return lock
+
+# Uploads saved by this process whose records are not committed yet, by
+# content hash: the stored file info and how many saved uploads use it.
+# Until the records exist, the database cannot tell that the files are used.
+_pending_blobs: Dict[str, dict] = {}
+
+def release_saved_files(file_infos: List[dict]):
+    """Drop the reservations of saved files once their records are committed or abandoned"""
+    for info in file_infos:
+        if "content_hash" not in info:
+            continue
+        pending = _pending_blobs[info["content_hash"]]
+        pending["count"] -= 1
+        if pending["count"] == 0:
+            del _pending_blobs[info["content_hash"]]
+
+async def remove_unused_files(content_hash: Optional[str], paths: List[str]):
+    """
+    Remove stored files unless a record or an upload still in progress uses them.
+    The reference check and the removal happen under the blob's exclusive
+    lock, which waits for uploads of the same content in other workers to
+    commit their records.
+    """
+    if content_hash is None:
+        # Files stored before content addressing belong to a single record
+        remove_stored_files(paths)
+        return
     
-    # Generate unique filename
-    filename = generate_unique_filename(file.filename)
+    async with blob_lock(content_hash):
+        if content_hash in _pending_blobs:
+            return
+        async with AsyncSessionLocal() as db, db.begin():
+            await lock_blobs(db, [content_hash], mode="exclusive")
+            in_use = await db.scalar(
+                select(MediaFile.id).where(MediaFile.content_hash == content_hash).limit(1)
+            )
+            if in_use is None:
+                remove_stored_files(paths)
+
+async def find_blob(content_hash: str) -> Optional[dict]:
+    """File info of an already stored upload with the same content, if any"""
+    pending = _pending_blobs.get(content_hash)
+    if pending is not None:
+        # Saved by a request that has not recorded it yet
+        return dict(pending["info"])
     
-    # File path
-    file_path = os.path.join(user_dir, filename)
+    async with AsyncSessionLocal() as db:
+        media = await db.scalar(
+            select(MediaFile).where(MediaFile.content_hash == content_hash).limit(1)
+        )
+    if media is None or not os.path.exists(media.file_path):
+        return None
+    return {
+        "saved_filename": os.path.basename(media.file_path),
+        "file_path": media.file_path,
+        "file_url": media.file_url,
+        "thumbnail_url": media.thumbnail_url or media.file_url,
+        "feed_url": media.feed_url or media.file_url,
+        "mime_type": media.mime_type,
+        "file_size": media.file_size,
+        "original_size": media.original_size,
+        "content_hash": content_hash
+    }
+
+async def store_blob(staged: dict) -> dict:
+    """Move a staged upload to its content-addressed name, then transcode it and make its variants"""
+    content_hash = staged["content_hash"]
+    loop = asyncio.get_running_loop()
     
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Two-character shards keep directories small
+    blob_dir = os.path.join(BLOB_DIR, content_hash[:2])
+    os.makedirs(blob_dir, exist_ok=True)
+    stored = dict(staged, file_path=os.path.join(blob_dir, content_hash + IMAGE_EXTENSIONS[staged["mime_type"]]))
+    os.replace(stored.pop("temp_path"), stored["file_path"])
+    original_size = stored["file_size"]
     
-    # Generate URL
-    relative_path = os.path.join("media", "uploads", str(user_id), filename)
-    file_url = f"/static/{relative_path}"
+    # Optionally re-encode into a smaller modern format
+    if TRANSCODE_FORMATS:
+        try:
+            transcoded = await loop.run_in_executor(
+                get_variant_pool(), transcode_image, stored["file_path"], TRANSCODE_FORMATS, MEDIA_TRANSCODE_QUALITY
+            )
+        except Exception as e:
+            # Keep the validated original
+            logger.warning(f"Could not transcode {stored['file_path']}: {e}")
+            transcoded = None
+        if transcoded:
+            stored.update(transcoded)
     
-    # Get file size
-    file_size = os.path.getsize(file_path)
+    # Downscaled copies for clients that do not need the full resolution
+    try:
+        variant_paths = await loop.run_in_executor(
+            get_variant_pool(), generate_variants, stored["file_path"], IMAGE_VARIANTS
+        )
+    except Exception as e:
+        # The upload itself is fine; clients fall back to the original
+        logger.warning(f"Could not generate variants of {stored['file_path']}: {e}")
+        variant_paths = {}
     
-    # Return file info for database
+    file_url = blob_url(stored["file_path"])
     return {
-        "filename": file.filename,
-        "saved_filename": filename,
-        "file_path": file_path,
+        "saved_filename": os.path.basename(stored["file_path"]),
+        "file_path": stored["file_path"],
         "file_url": file_url,
-        "mime_type": file.content_type,
-        "file_size": file_size
+        # Variants not generated because the original is small enough are served by it
+        "thumbnail_url": blob_url(variant_paths["thumbnail"]) if "thumbnail" in variant_paths else file_url,
+        "feed_url": blob_url(variant_paths["feed"]) if "feed" in variant_paths else file_url,
+        "mime_type": stored["mime_type"],
+        "file_size": stored["file_size"],
+        "original_size": original_size,
+        "content_hash": content_hash
     }
 
-async def save_multiple_files(files: List[UploadFile], user_id: int) -> List[dict]:
-    """Save multiple uploaded files and return their info"""
-    if len(files) > 9:
-        raise HTTPException(status_code=400, detail="Maximum 9 images allowed per post")
+async def stage_upload_file(file: UploadFile) -> dict:
+    """Check an upload's declared type, then stream, hash and validate it off the event loop"""
+    # Ensure media directory exists
+    blob_dir = ensure_media_dir()
+    
+    # Check the declared type before reading anything
+    validate_content_type(file)
+    
+    return await asyncio.get_running_loop().run_in_executor(media_executor, stage_upload, file.file, blob_dir)
+
+async def save_upload_file(file: UploadFile, user_id: int, db: AsyncSession) -> dict:
+    """
+    Save an uploaded file to content-addressed storage. Content that is
+    already stored is not stored again; the new record shares its files.
+    Returns file info for database storage. The files stay reserved until
+    the caller records them in the open transaction of `db`, see
+    recording_saved_files.
+    """
+    staged = await stage_upload_file(file)
+    try:
+        await lock_blobs(db, [staged["content_hash"]])
+    except BaseException:
+        os.unlink(staged["temp_path"])
+        raise
+    return await save_staged_file(staged, file.filename)
+
+async def save_staged_file(staged: dict, filename: str) -> dict:
+    """Store a staged upload, or drop it in favor of the stored copy of the same content"""
+    async with blob_lock(staged["content_hash"]):
+        info = await find_blob(staged["content_hash"])
+        if info is not None:
+            # Same content as an earlier upload
+            os.unlink(staged["temp_path"])
+        else:
+            info = await store_blob(staged)
+        
+        # Reserve the files before the lock is released
+        pending = _pending_blobs.setdefault(staged["content_hash"], {"info": dict(info), "count": 0})
+        pending["count"] += 1
+    
+    # Return file info for database
+    info["filename"] = filename
+    return info
+
+async def save_multiple_files(files: List[UploadFile], user_id: int, db: AsyncSession) -> List[dict]:
+    """
+    Save multiple uploaded files concurrently and return their info in the
+    order given. A file that fails does not stop the others; its entry holds
+    its filename and an "error" message instead. Like save_upload_file, the
+    files are reserved by the open transaction of `db`.
+    """
+    if len(files) > MAX_FILES_PER_BATCH:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_FILES_PER_BATCH} images allowed per post")
+    
+    staged = await asyncio.gather(*(stage_upload_file(file) for file in files), return_exceptions=True)
+    
+    # Lock the whole batch at once, as the session runs one statement at a time
+    try:
+        await lock_blobs(db, [info["content_hash"] for info in staged if not isinstance(info, BaseException)])
+    except BaseException:
+        for info in staged:
+            if not isinstance(info, BaseException):
+                os.unlink(info["temp_path"])
+        raise
+    
+    outcomes = await asyncio.gather(*(
+        save_staged_file(info, file.filename)
+        for file, info in zip(files, staged) if not isinstance(info, BaseException)
+    ), return_exceptions=True)
+    saved = iter(outcomes)
+    outcomes = [info if isinstance(info, BaseException) else next(saved) for info in staged]
     
     results = []
-    for file in files:
-        file_info = await save_upload_file(file, user_id)
-        results.append(file_info)
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, HTTPException):
+            results.append({"filename": file.filename, "error": outcome.detail})
+        elif isinstance(outcome, Exception):
+            results.append({"filename": file.filename, "error": f"Failed to save file: {str(outcome)}"})
+        else:
+            results.append(outcome)
     
-    return results 
\ No newline at end of file
+    return results
+
+def failed_uploads(file_infos: List[dict]) -> List[dict]:
+    """Per-file errors of a batch saved with save_multiple_files"""
+    return [{"filename": info["filename"], "error": info["error"]} for info in file_infos if "error" in info]
+
+async def discard_saved_files(db: AsyncSession, file_infos: List[dict]):
+    """Release the files saved for a batch that is not going to be used and remove those nothing else uses"""
+    # End the transaction holding the blob locks first, removal takes them exclusively
+    await db.rollback()
+    release_saved_files(file_infos)
+    for info in file_infos:
+        if "content_hash" in info:
+            paths = _stored_paths(info["file_path"], info["file_url"], (info["thumbnail_url"], info["feed_url"]))
+            await remove_unused_files(info["content_hash"], paths)
+
+@asynccontextmanager
+async def recording_saved_files(db: AsyncSession, file_infos: List[dict]):
+    """
+    Write the records of saved files with `db` inside this block, committing
+    the transaction that holds their locks. The files are released when it
+    completes, and removed unless still used when it fails.
+    """
+    try:
+        yield
+    except BaseException:
+        await discard_saved_files(db, file_infos)
+        raise
+    release_saved_files(file_infos)
@@ -0,0 +1,51 @@
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, desc
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+import base64
+import uuid
+
+# Response header carrying the cursor for the next page on list endpoints
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(created_at: datetime, row_id: uuid.UUID) -> str:
+    """Encode a (created_at, id) position as an opaque, URL-safe cursor"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def after_cursor(created_at_column, id_column, cursor: str):
+    """Condition for rows strictly after a cursor position in newest-first order"""
+    created_at, row_id = decode_cursor(cursor)
+    return or_(
+        created_at_column < created_at,
+        and_(created_at_column == created_at, id_column < row_id)
+    )
+
+def paginate(query, created_at_column, id_column, skip: int = 0, limit: int = 20, cursor: Optional[str] = None):
+    """
+    Order a query newest-first on (created_at, id) and page it.
+    With a cursor the page starts strictly after that position (keyset);
+    otherwise skip/limit are applied as before for older clients.
+    """
+    query = query.order_by(desc(created_at_column), desc(id_column))
+
+    if cursor:
+        return query.filter(after_cursor(created_at_column, id_column, cursor)).limit(limit)
+
+    return query.offset(skip).limit(limit)
+
+def next_cursor(items: List[Any], limit: int) -> Optional[str]:
+    """Cursor for the page after items, or None when this was the last page"""
+    if not items or len(items) < limit:
+        return None
+    last = items[-1]
+    return encode_cursor(last.created_at, last.id)
@@ -0,0 +1,240 @@
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional
+from urllib.parse import urlparse
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps events inside one worker process; "redis" shares them between workers and nodes
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory").lower()
+# Any server speaking the Redis protocol (Redis, Valkey, KeyDB, ...)
+PUBSUB_URL = os.getenv("PUBSUB_URL", "redis://localhost:6379/0")
+# Channel WebSocket events are published on
+PUBSUB_CHANNEL = os.getenv("PUBSUB_CHANNEL", "social_board:events")
+
+MessageHandler = Callable[[str], Awaitable[None]]
+
+class InProcessPubSub:
+    """Backplane for a single worker: published messages are handed straight back"""
+    name = "memory"
+
+    def __init__(self, on_message: MessageHandler):
+        self.on_message = on_message
+        self.published = 0
+        self.received = 0
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, message: str):
+        self.published += 1
+        self.received += 1
+        await self.on_message(message)
+
+    def snapshot(self) -> dict:
+        return {"backend": self.name, "published": self.published, "received": self.received}
+
+class RedisProtocolError(Exception):
+    pass
+
+def _encode_command(*args: str) -> bytes:
+    """Encode a command as a RESP array of bulk strings"""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg.encode() if isinstance(arg, str) else arg
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(parts)
+
+async def _read_reply(reader: asyncio.StreamReader):
+    """Read one RESP reply"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by pub/sub server")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        raise RedisProtocolError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+    raise RedisProtocolError(f"Unexpected reply: {line!r}")
+
+class RedisPubSub:
+    """
+    Backplane over the Redis protocol, using PUBLISH and SUBSCRIBE on one channel.
+    Every worker subscribes, so a message published by any worker (including
+    this one) comes back through the subscription and is delivered locally
+    exactly once. Speaks RESP directly over asyncio streams, so no client
+    library is required and any compatible server can be used.
+    Publishes are pipelined on one connection: commands are written as they
+    come and a reader task matches the integer replies to them in order.
+    """
+    name = "redis"
+
+    def __init__(self, on_message: MessageHandler, url: str = PUBSUB_URL, channel: str = PUBSUB_CHANNEL):
+        self.on_message = on_message
+        self.url = urlparse(url)
+        self.channel = channel
+        self._publisher: Optional[asyncio.StreamWriter] = None
+        self._connect_lock = asyncio.Lock()
+        # Futures of the PUBLISH commands waiting for their reply, oldest first
+        self._pending_replies: Deque[asyncio.Future] = deque()
+        self._reply_task: Optional[asyncio.Task] = None
+        self._subscriber_task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.publish_errors = 0
+        self.reconnects = 0
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.url.hostname or "localhost", self.url.port or 6379)
+        if self.url.password:
+            auth = [self.url.username, self.url.password] if self.url.username else [self.url.password]
+            writer.write(_encode_command("AUTH", *auth))
+            await writer.drain()
+            await _read_reply(reader)
+        return reader, writer
+
+    async def start(self):
+        if self._subscriber_task is None:
+            self._subscriber_task = asyncio.create_task(self._subscribe())
+
+    async def stop(self):
+        if self._subscriber_task is not None:
+            self._subscriber_task.cancel()
+            try:
+                await self._subscriber_task
+            except asyncio.CancelledError:
+                pass
+            self._subscriber_task = None
+        if self._publisher is not None:
+            self._drop_publisher(self._publisher, ConnectionError("Pub/sub backplane stopped"))
+
+    async def _subscribe(self):
+        """Receive messages from the channel, reconnecting with backoff"""
+        delay = 0.5
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._open()
+                writer.write(_encode_command("SUBSCRIBE", self.channel))
+                await writer.drain()
+                delay = 0.5
+                while True:
+                    reply = await _read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        self.received += 1
+                        try:
+                            await self.on_message(reply[2].decode())
+                        except Exception as e:
+                            logger.error(f"Error delivering pub/sub message: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.reconnects += 1
+                logger.warning(f"Pub/sub subscription lost ({e}), reconnecting in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    async def _publisher_connection(self) -> asyncio.StreamWriter:
+        async with self._connect_lock:
+            if self._publisher is None:
+                reader, writer = await self._open()
+                self._publisher = writer
+                self._reply_task = asyncio.create_task(self._read_publish_replies(reader, writer))
+            return self._publisher
+
+    async def _read_publish_replies(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Hand each reply on the publishing connection to the oldest waiting PUBLISH"""
+        try:
+            while True:
+                try:
+                    reply = await _read_reply(reader)
+                except RedisProtocolError as e:
+                    # An error reply answers one command; the connection is still usable
+                    reply = e
+                if not self._pending_replies:
+                    raise RedisProtocolError("Reply without a pending command")
+                future = self._pending_replies.popleft()
+                if future.done():
+                    continue
+                if isinstance(reply, Exception):
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._drop_publisher(writer, e)
+
+    def _drop_publisher(self, writer: asyncio.StreamWriter, error: Exception):
+        """Close a publishing connection and fail the commands still waiting on it"""
+        if self._publisher is not writer:
+            return
+        self._publisher = None
+        writer.close()
+        if self._reply_task is not None and self._reply_task is not asyncio.current_task():
+            self._reply_task.cancel()
+        self._reply_task = None
+        while self._pending_replies:
+            future = self._pending_replies.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    async def publish(self, message: str):
+        writer = None
+        try:
+            writer = await self._publisher_connection()
+            reply = asyncio.get_running_loop().create_future()
+            writer.write(_encode_command("PUBLISH", self.channel, message))
+            self._pending_replies.append(reply)
+            await writer.drain()
+            receivers = await reply
+            self.published += 1
+            if receivers:
+                return
+            # Not even this worker's subscription is up (it is reconnecting)
+        except Exception as e:
+            self.publish_errors += 1
+            if writer is not None and not isinstance(e, RedisProtocolError):
+                self._drop_publisher(writer, e)
+            logger.error(f"Pub/sub publish failed, delivering to this worker only: {e}")
+        # Other workers miss this message, but local clients still get it
+        await self.on_message(message)
+
+    def snapshot(self) -> dict:
+        return {
+            "backend": self.name,
+            "channel": self.channel,
+            "published": self.published,
+            "received": self.received,
+            "publish_errors": self.publish_errors,
+            "reconnects": self.reconnects
+        }
+
+def create_pubsub(on_message: MessageHandler, backend: str = PUBSUB_BACKEND):
+    """Build the backplane selected by PUBSUB_BACKEND"""
+    if backend == "redis":
+        return RedisPubSub(on_message)
+    if backend != "memory":
+        logger.warning(f"Unknown PUBSUB_BACKEND {backend!r}, using in-process delivery")
+    return InProcessPubSub(on_message)
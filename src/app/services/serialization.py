@@ -0,0 +1,41 @@
+from datetime import date, datetime
+from typing import Any
+import json
+import uuid
+
+from pydantic import BaseModel
+
+try:
+    # orjson encodes UUID and datetime natively and is several times faster than json
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj: Any) -> str:
+    """Encode a value as compact JSON, with UUIDs as strings and datetimes in ISO 8601"""
+    if isinstance(obj, str):
+        # Already encoded
+        return obj
+    if isinstance(obj, BaseModel):
+        return obj.model_dump_json()
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default).decode()
+    return json.dumps(obj, default=_default, separators=(",", ":"))
+
+def encode_event(event_type: str, data: Any) -> str:
+    """
+    Encode a WebSocket event frame once, so the same string can be queued for
+    every recipient. `data` may be a pydantic model (encoded by pydantic's own
+    serializer without an intermediate dict), a plain value, or JSON that is
+    already encoded.
+    """
+    return f'{{"type":{json.dumps(event_type)},"data":{dumps(data)}}}'
@@ -0,0 +1,136 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, select, delete, union_all, literal, desc
+from datetime import datetime, timedelta
+from typing import List, Optional
+import os
+import uuid
+
+from ..models.model import Post, Follower, UserProfile, TimelineEntry
+from .pagination import after_cursor
+
+# Authors with more followers than this are not fanned out on write;
+# their posts are merged into followers' home timelines at read time instead
+HOME_TIMELINE_FANOUT_LIMIT = int(os.getenv("HOME_TIMELINE_FANOUT_LIMIT", "10000"))
+# Number of recent posts copied into a timeline when a user follows someone
+HOME_TIMELINE_BACKFILL = int(os.getenv("HOME_TIMELINE_BACKFILL", "50"))
+# Days materialized timeline entries are kept before trim_timelines removes them (0 keeps them)
+HOME_TIMELINE_RETENTION_DAYS = int(os.getenv("HOME_TIMELINE_RETENTION_DAYS", "30"))
+
+def _is_high_fanout(db: Session, author_id: uuid.UUID) -> bool:
+    follower_count = db.query(UserProfile.follower_count).filter(UserProfile.user_id == author_id).scalar()
+    return (follower_count or 0) > HOME_TIMELINE_FANOUT_LIMIT
+
+def fan_out_post(db: Session, post: Post):
+    """
+    Write a new post into the home timeline of every follower of its author.
+    Done as one INSERT ... SELECT over the followers table; skipped for
+    high-follower authors, whose posts are merged in on read.
+    The caller commits.
+    """
+    if _is_high_fanout(db, post.author_id):
+        return
+
+    followers = select(
+        Follower.follower_id,
+        literal(post.id, TimelineEntry.post_id.type),
+        literal(post.author_id, TimelineEntry.author_id.type),
+        literal(post.created_at, TimelineEntry.created_at.type)
+    ).filter(Follower.following_id == post.author_id)
+
+    db.execute(
+        insert(TimelineEntry).from_select(
+            ["user_id", "post_id", "author_id", "created_at"], followers
+        )
+    )
+
+def backfill_timeline(db: Session, user_id: uuid.UUID, author_id: uuid.UUID):
+    """Copy an author's recent posts into a user's timeline after a follow. The caller commits."""
+    if _is_high_fanout(db, author_id):
+        return
+
+    recent_posts = select(
+        literal(user_id, TimelineEntry.user_id.type),
+        Post.id,
+        Post.author_id,
+        Post.created_at
+    ).filter(
+        Post.author_id == author_id,
+        Post.reply_to_post_id.is_(None),
+        ~Post.id.in_(select(TimelineEntry.post_id).filter(TimelineEntry.user_id == user_id))
+    ).order_by(desc(Post.created_at)).limit(HOME_TIMELINE_BACKFILL)
+
+    db.execute(
+        insert(TimelineEntry).from_select(
+            ["user_id", "post_id", "author_id", "created_at"], recent_posts
+        )
+    )
+
+def remove_author_from_timeline(db: Session, user_id: uuid.UUID, author_id: uuid.UUID):
+    """Drop an author's posts from a user's timeline after an unfollow. The caller commits."""
+    db.execute(
+        delete(TimelineEntry).filter(
+            TimelineEntry.user_id == user_id,
+            TimelineEntry.author_id == author_id
+        )
+    )
+
+def trim_timelines(db: Session, retention_days: int = HOME_TIMELINE_RETENTION_DAYS) -> int:
+    """
+    Delete timeline entries of posts older than the retention period and
+    return how many were removed. Without this the table grows by one row
+    per follower for every post. The caller commits.
+    """
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    result = db.execute(delete(TimelineEntry).filter(TimelineEntry.created_at < cutoff))
+    return result.rowcount
+
+def _newest_first(columns, created_at_column, id_column, conditions, cursor: Optional[str], depth: int):
+    """One source of a home timeline page: its first `depth` rows by one index range"""
+    if cursor:
+        conditions = conditions + [after_cursor(created_at_column, id_column, cursor)]
+    return select(*columns).where(*conditions).order_by(
+        desc(created_at_column), desc(id_column)
+    ).limit(depth).subquery()
+
+def get_home_timeline_ids(db: Session, user_id: uuid.UUID, skip: int = 0, limit: int = 20,
+                          cursor: Optional[str] = None) -> List[uuid.UUID]:
+    """
+    Ids of one page of a user's home timeline, newest first: the materialized
+    entries, plus posts by followed high-follower authors and the user's own
+    posts read directly. Each source is read through its own index range
+    (timeline entries of the user by time, posts of one author by time) and
+    only its first skip + limit rows are merged, so the cost of a page does
+    not depend on the size of the posts table.
+    """
+    depth = skip + limit
+
+    high_fanout_followees = db.execute(
+        select(Follower.following_id).join(
+            UserProfile, UserProfile.user_id == Follower.following_id
+        ).where(
+            Follower.follower_id == user_id,
+            UserProfile.follower_count > HOME_TIMELINE_FANOUT_LIMIT
+        )
+    ).scalars().all()
+
+    # Entries written before an author crossed the fan-out limit are read from posts instead
+    entry_conditions = [TimelineEntry.user_id == user_id]
+    if high_fanout_followees:
+        entry_conditions.append(TimelineEntry.author_id.notin_(high_fanout_followees))
+    sources = [_newest_first(
+        [TimelineEntry.post_id.label("id"), TimelineEntry.created_at.label("created_at")],
+        TimelineEntry.created_at, TimelineEntry.post_id, entry_conditions, cursor, depth
+    )]
+    for author_id in [*high_fanout_followees, user_id]:
+        sources.append(_newest_first(
+            [Post.id.label("id"), Post.created_at.label("created_at")],
+            Post.created_at, Post.id,
+            [Post.author_id == author_id, Post.reply_to_post_id.is_(None)], cursor, depth
+        ))
+
+    merged = union_all(*(select(source.c.id, source.c.created_at) for source in sources)).subquery()
+    return db.execute(
+        select(merged.c.id).order_by(desc(merged.c.created_at), desc(merged.c.id)).offset(skip).limit(limit)
+    ).scalars().all()
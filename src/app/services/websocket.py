@@ -1,117 +1,768 @@
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List, Any
-import json
+from fastapi import WebSocket, WebSocketDisconnect, status
+from typing import Dict, List, Any, Iterable, Optional, Set, Tuple
+from collections import deque
+from itertools import islice
 import asyncio
+import logging
+import os
+import time
 from datetime import datetime
 import uuid
 
-class DateTimeEncoder(json.JSONEncoder):
-    """JSON encoder that handles datetime and UUID objects."""
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        if isinstance(obj, uuid.UUID):
-            return str(obj)
-        return super().default(obj)
+from sqlalchemy import select
+
+from .pubsub import create_pubsub
+from .serialization import dumps, encode_event
+from .database import AsyncSessionLocal
+from .counters import counter_buffer
+from ..models.model import Post, Follower
+
+logger = logging.getLogger(__name__)
+
+# Messages buffered per connection before it counts as too slow
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# What to do with a connection whose queue is full: "disconnect" it or "drop" the message
+WS_QUEUE_OVERFLOW = os.getenv("WS_QUEUE_OVERFLOW", "disconnect").lower()
+# Maximum number of topics one connection may subscribe to
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "100"))
+
+# Topic kinds whose events can be coalesced
+COALESCED_TOPIC_KINDS = ("post",)
+
+def parse_coalesce_intervals(value: str) -> Dict[str, float]:
+    """
+    Parse "kind=ms,kind=ms" into seconds per topic kind; 0 turns coalescing
+    off for that kind. Entries for kinds that cannot be coalesced, and
+    malformed entries, are ignored with a warning.
+    """
+    intervals = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        kind, _, ms = (part.strip() for part in item.partition("="))
+        if kind not in COALESCED_TOPIC_KINDS or not ms.isdigit():
+            logger.warning(f"Ignoring WS_COALESCE_INTERVALS entry {item.strip()!r}; "
+                           f"expected <kind>=<ms> with kind one of {', '.join(COALESCED_TOPIC_KINDS)}")
+            continue
+        intervals[kind] = int(ms) / 1000
+    return intervals
+
+# Seconds between heartbeats sent to each connection
+WS_HEARTBEAT_INTERVAL = int(os.getenv("WS_HEARTBEAT_INTERVAL", "30"))
+# Seconds a client has to answer a heartbeat before it is treated as dead
+WS_PONG_TIMEOUT = int(os.getenv("WS_PONG_TIMEOUT", "10"))
+
+# Recent events each worker keeps for clients reconnecting with ?since=<seq>
+WS_REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "1000"))
+
+# How often coalesced events are sent, per topic kind (off by default). Like and
+# repost events on post topics are merged into one post_counters frame per post per interval.
+WS_COALESCE_INTERVALS = parse_coalesce_intervals(os.getenv("WS_COALESCE_INTERVALS", ""))
+
+# Topics a connection can subscribe to:
+#   home                new posts by accounts the connection's user follows, and its own (authenticated only)
+#   feed                every new post (the public feed)
+#   post:<post_id>      likes, reposts and replies of one post
+#   user:<user_id>      posts and reposts by one user
+#   notifications       the connection's own notifications (authenticated only)
+HOME_TOPIC = "home"
+FEED_TOPIC = "feed"
+
+def post_topic(post_id) -> str:
+    return f"post:{post_id}"
+
+def user_topic(user_id) -> str:
+    return f"user:{user_id}"
+
+def notification_topic(user_id) -> str:
+    return f"notifications:{user_id}"
+
+def followers_target(user_id) -> str:
+    """Routes an event to the home topic of a user's online followers; not subscribable"""
+    return f"followers:{user_id}"
+
+def parse_topic(topic: Any, user_id: Optional[uuid.UUID] = None) -> Optional[str]:
+    """Validate a topic sent by a client and return its canonical form, or None"""
+    if not isinstance(topic, str):
+        return None
+    if topic == FEED_TOPIC:
+        return topic
+    if topic == HOME_TOPIC:
+        return topic if user_id else None
+    if topic == "notifications":
+        return notification_topic(user_id) if user_id else None
+    kind, _, value = topic.partition(":")
+    if kind not in ("post", "user"):
+        return None
+    try:
+        return f"{kind}:{uuid.UUID(value)}"
+    except ValueError:
+        return None
+
+def _field(data: Any, name: str):
+    """Read a routing field from an event given as a response model or a dict"""
+    return data.get(name) if isinstance(data, dict) else getattr(data, name, None)
+
+class RateCounter:
+    """Counts events per second over a sliding window of recent seconds"""
+    def __init__(self, window: int = 60):
+        self.window = window
+        self.total = 0
+        self._seconds: Dict[int, int] = {}
+
+    def record(self):
+        self.total += 1
+        second = int(time.monotonic())
+        self._seconds[second] = self._seconds.get(second, 0) + 1
+        if len(self._seconds) > self.window:
+            for old in [s for s in self._seconds if s <= second - self.window]:
+                del self._seconds[old]
+
+    def per_second(self, seconds: int = 10) -> float:
+        """Average rate over the last complete `seconds` seconds"""
+        now = int(time.monotonic())
+        count = sum(n for second, n in self._seconds.items() if now - seconds <= second < now)
+        return round(count / seconds, 2)
+
+class ReplayBuffer:
+    """
+    Ring buffer of the latest events delivered on this worker. Each event is
+    stamped with a resume token "<epoch>-<n>": n grows by one per event and the
+    epoch is new for every process, so a token handed out before a restart (or
+    by another worker) is recognised instead of being matched to the wrong event.
+    """
+    def __init__(self, size: int = WS_REPLAY_BUFFER_SIZE):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        # (seq, topics or None for a broadcast, stamped message JSON)
+        self.events: deque = deque(maxlen=max(size, 0))
+        self.replayed = 0
+        self.resyncs = 0
+
+    @property
+    def position(self) -> str:
+        """Token of the latest event, for a client that is up to date"""
+        return f"{self.epoch}-{self.seq}"
+
+    def stamp(self, topics: Optional[List[str]], message_json: str) -> str:
+        """Add the next sequence token to an event and keep it for replay"""
+        self.seq += 1
+        if message_json.startswith("{") and not message_json[1:].lstrip().startswith("}"):
+            # Splice the token into the encoded object instead of re-encoding it
+            message_json = f'{{"seq":"{self.position}",{message_json[1:]}'
+        self.events.append((self.seq, topics, message_json))
+        return message_json
+
+    def after(self, token: str) -> Optional[List[Tuple[int, Optional[List[str]], str]]]:
+        """
+        Events newer than a resume token, or None when they cannot be replayed
+        because the token is malformed, from another epoch or already evicted.
+        """
+        epoch, _, seq = (token or "").rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        first = self.events[0][0] if self.events else self.seq + 1
+        if seq > self.seq or seq < first - 1:
+            return None
+        return list(islice(self.events, seq - first + 1, None))
+
+    def snapshot(self) -> dict:
+        return {
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "buffered": len(self.events),
+            "capacity": self.events.maxlen,
+            "replayed_messages": self.replayed,
+            "resyncs": self.resyncs
+        }
+
+class Connection:
+    """
+    Registry entry for one WebSocket: who it belongs to, what it is
+    subscribed to and when it connected, plus its outbound side, a bounded
+    queue drained by its own task so a slow client only ever delays itself.
+    """
+    def __init__(self, websocket: WebSocket, user_id: Optional[uuid.UUID], max_size: int = WS_SEND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.connected_at = datetime.utcnow()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.task: Optional[asyncio.Task] = None
+        self.topics: Set[str] = set()
+        self.dropped = 0
+        # Heartbeat state, maintained by the HeartbeatScheduler
+        self.wheel_slot: Optional[int] = None
+        self.last_ping = 0.0
+        self.last_seen = time.monotonic()
+        self.awaiting_pong = False
+
+    def start(self):
+        self.task = asyncio.create_task(self._drain())
+
+    async def _drain(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                await self.websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Connection closed; the receive loop will notice and disconnect it
+            pass
+
+    def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    @property
+    def broken(self) -> bool:
+        """True once the writer has stopped because the socket failed"""
+        return self.task is not None and self.task.done()
+
+class HeartbeatScheduler:
+    """
+    One task sending heartbeats to every connection, instead of a sleeping
+    task per socket. Connections sit in the slots of a timing wheel that
+    advances one slot per second; each tick only touches the connections due
+    in that slot.
+    A due connection whose writer has failed is removed. Otherwise it gets a
+    heartbeat, and then has WS_PONG_TIMEOUT seconds to show activity (a
+    {"type": "pong"} or any other message) or it is treated as dead and
+    removed.
+    """
+    TICK = 1.0
+
+    def __init__(self, manager: "ConnectionManager", interval: int = WS_HEARTBEAT_INTERVAL, pong_timeout: int = WS_PONG_TIMEOUT):
+        self.manager = manager
+        self.interval_ticks = max(1, int(interval / self.TICK))
+        self.timeout_ticks = max(1, min(int(pong_timeout / self.TICK), self.interval_ticks))
+        self.slots: List[Set[WebSocket]] = [set() for _ in range(self.interval_ticks + 1)]
+        self.cursor = 0
+        self._task: Optional[asyncio.Task] = None
+        self.heartbeats = 0
+        self.pong_timeouts = 0
+        self.broken_connections = 0
+
+    def _schedule(self, websocket: WebSocket, connection: "Connection", ticks: int):
+        if connection.wheel_slot is not None:
+            self.slots[connection.wheel_slot].discard(websocket)
+        connection.wheel_slot = (self.cursor + ticks) % len(self.slots)
+        self.slots[connection.wheel_slot].add(websocket)
+
+    def add(self, websocket: WebSocket, connection: "Connection"):
+        self._schedule(websocket, connection, self.interval_ticks)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def remove(self, websocket: WebSocket, connection: "Connection"):
+        if connection.wheel_slot is not None:
+            self.slots[connection.wheel_slot].discard(websocket)
+            connection.wheel_slot = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.TICK)
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Error in WebSocket heartbeat: {e}")
+
+    def tick(self):
+        """Advance the wheel one slot and handle the connections due in it"""
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        due, self.slots[self.cursor] = self.slots[self.cursor], set()
+        now = time.monotonic()
+
+        for websocket in due:
+            connection = self.manager.connections.get(websocket)
+            if connection is None:
+                continue
+            connection.wheel_slot = None
+
+            if connection.broken:
+                self.broken_connections += 1
+                self.manager.drop_connection(websocket, status.WS_1011_INTERNAL_ERROR)
+                continue
+
+            if connection.awaiting_pong:
+                connection.awaiting_pong = False
+                if connection.last_seen < connection.last_ping:
+                    self.pong_timeouts += 1
+                    self.manager.drop_connection(websocket, status.WS_1001_GOING_AWAY)
+                    continue
+                # Answered in time; next heartbeat one interval after the last one
+                self._schedule(websocket, connection, max(1, self.interval_ticks - self.timeout_ticks))
+                continue
+
+            self.manager.enqueue(websocket, '{"type": "heartbeat"}')
+            self.heartbeats += 1
+            connection.last_ping = now
+            connection.awaiting_pong = True
+            self._schedule(websocket, connection, self.timeout_ticks)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+class PostCounterCoalescer:
+    """
+    Merges like and repost events per post into periodic post_counters frames.
+    During a burst a post's subscribers get one frame per interval carrying
+    the latest counts (read once for all pending posts, plus any counts still
+    in the counter buffer) instead of one frame per like.
+    Each worker coalesces the events it produced, so with N workers a post
+    gets at most N frames per interval.
+    """
+    def __init__(self, manager: "ConnectionManager", interval: float):
+        self.manager = manager
+        self.interval = interval
+        self._pending: Dict[str, Dict[str, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.events = 0
+        self.frames = 0
+
+    def add(self, post_id, likes: int = 0, reposts: int = 0):
+        """Record a like/repost event; the frame goes out with the next flush"""
+        counts = self._pending.setdefault(str(post_id), {"new_likes": 0, "new_reposts": 0})
+        counts["new_likes"] += likes
+        counts["new_reposts"] += reposts
+        self.events += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error sending post counter frames: {e}")
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(Post.id, Post.like_count, Post.repost_count)
+                .where(Post.id.in_([uuid.UUID(post_id) for post_id in pending]))
+            )).all()
+
+        for post_id, like_count, repost_count in rows:
+            await self.manager.publish([post_topic(post_id)], encode_event("post_counters", {
+                "post_id": str(post_id),
+                "like_count": (like_count or 0) + counter_buffer.pending_delta(post_id, "like_count"),
+                "repost_count": (repost_count or 0) + counter_buffer.pending_delta(post_id, "repost_count"),
+                **pending[str(post_id)]
+            }))
+            self.frames += 1
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
 
 class ConnectionManager:
     """
     Manages WebSocket connections for real-time updates
     """
-    def __init__(self):
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE, overflow: str = WS_QUEUE_OVERFLOW):
         # Active connections mapped by user_id
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
         # All connections for broadcasting
-        self.broadcast_connections: List[WebSocket] = []
+        self.broadcast_connections: Set[WebSocket] = set()
+        # Subscribed connections by topic
+        self.topics: Dict[str, Set[WebSocket]] = {}
+        # Metadata, outbound queue and writer task of every connection
+        self.connections: Dict[WebSocket, Connection] = {}
+        self.queue_size = queue_size
+        self.overflow = overflow
+        # Events go through the backplane so clients on every worker receive them
+        self.pubsub = create_pubsub(self._deliver)
+        # Like/repost events for post topics are coalesced unless its interval is 0
+        post_interval = WS_COALESCE_INTERVALS.get("post", 0)
+        self.post_counters = PostCounterCoalescer(self, post_interval) if post_interval > 0 else None
+        # Heartbeats and dead-peer detection for all connections
+        self.heartbeat = HeartbeatScheduler(self)
+        # Sequence numbers and recent events for resuming clients
+        self.replay = ReplayBuffer()
+        # Follow graph of the users online on this worker, both ways:
+        # user -> accounts they follow, and author -> online users following them
+        self.followees: Dict[str, Set[str]] = {}
+        self.online_followers: Dict[str, Set[str]] = {}
+        # Delivery metrics
+        self.enqueued_messages = 0
+        self.dropped_messages = 0
+        self.overflow_disconnects = 0
+        self.connects = RateCounter()
+        self.disconnects = RateCounter()
     
-    async def connect(self, websocket: WebSocket, user_id: uuid.UUID = None):
-        """Connect a WebSocket client"""
+    async def start(self):
+        """Start receiving events from other workers"""
+        await self.pubsub.start()
+    
+    async def stop(self):
+        await self.heartbeat.stop()
+        if self.post_counters:
+            await self.post_counters.stop()
+        await self.pubsub.stop()
+    
+    async def connect(self, websocket: WebSocket, user_id: uuid.UUID = None, topics: Optional[Iterable[str]] = None,
+                      since: Optional[str] = None):
+        """
+        Connect a WebSocket client.
+        Unless topics are given, an authenticated client is subscribed to its
+        home topic and its own notifications; anonymous clients, which have no
+        follows to route on, are subscribed to the feed as before. A client reconnecting
+        with the `seq` of the last event it received passes it as `since`
+        to get the events it missed (see resume()); only events of the topics
+        subscribed here can be replayed.
+        """
         await websocket.accept()
         
-        # Add to broadcast list
-        self.broadcast_connections.append(websocket)
+        # The first connection of a user brings its follows into the index
+        if user_id and str(user_id) not in self.followees:
+            await self._load_followees(user_id)
+        
+        connection = Connection(websocket, user_id, self.queue_size)
+        connection.start()
+        self.connections[websocket] = connection
+        self.heartbeat.add(websocket, connection)
+        
+        if topics is None:
+            topics = [HOME_TOPIC, notification_topic(user_id)] if user_id else [FEED_TOPIC]
+        for topic in topics:
+            self.subscribe(websocket, topic)
         
-        # If user is authenticated, add to user-specific list
+        # Add to broadcast set
+        self.broadcast_connections.add(websocket)
+        
+        # If user is authenticated, add to user-specific set
         if user_id:
-            user_id_str = str(user_id)
-            if user_id_str not in self.active_connections:
-                self.active_connections[user_id_str] = []
-            self.active_connections[user_id_str].append(websocket)
+            self.active_connections.setdefault(str(user_id), set()).add(websocket)
+        
+        self.connects.record()
+        
+        # Nothing is awaited between registering and replaying, so no live
+        # event can be queued ahead of the missed ones
+        if since is not None:
+            self.resume(websocket, since)
+    
+    def resume(self, websocket: WebSocket, since: str):
+        """
+        Queue the buffered events after `since` that match the connection's
+        topics, then a {"type": "resumed"} frame. When they are no longer
+        available, or would not fit into the send queue, the client gets
+        {"type": "resync"} instead and should reload over HTTP. Both frames
+        carry the current `seq` to resume from next time.
+        """
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        events = self.replay.after(since)
+        if events is not None:
+            events = [message_json for _, topics, message_json in events
+                      if topics is None or any(self._receives(connection, topic) for topic in topics)]
+        if events is None or len(events) >= self.queue_size:
+            self.replay.resyncs += 1
+            self.enqueue(websocket, dumps({"type": "resync", "seq": self.replay.position}))
+            return
+        for message_json in events:
+            self.enqueue(websocket, message_json)
+        self.replay.replayed += len(events)
+        self.enqueue(websocket, dumps({"type": "resumed", "seq": self.replay.position, "replayed": len(events)}))
     
     def disconnect(self, websocket: WebSocket, user_id: uuid.UUID = None):
-        """Disconnect a WebSocket client"""
-        # Remove from broadcast list
-        if websocket in self.broadcast_connections:
-            self.broadcast_connections.remove(websocket)
+        """
+        Disconnect a WebSocket client. Every step is a dict or set operation,
+        so a reconnect storm costs O(1) per socket. The user id is taken from
+        the registry; the argument is accepted for existing callers.
+        """
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            # Already disconnected
+            return
         
-        # If user was authenticated, remove from user-specific list
-        if user_id:
-            user_id_str = str(user_id)
-            if user_id_str in self.active_connections:
-                if websocket in self.active_connections[user_id_str]:
-                    self.active_connections[user_id_str].remove(websocket)
+        # Stop its writer; anything still queued is discarded
+        connection.stop()
+        self.heartbeat.remove(websocket, connection)
+        for topic in list(connection.topics):
+            self.unsubscribe(websocket, topic)
+        
+        # Remove from broadcast set
+        self.broadcast_connections.discard(websocket)
+        
+        # If user was authenticated, remove from user-specific set
+        if connection.user_id:
+            user_id_str = str(connection.user_id)
+            user_connections = self.active_connections.get(user_id_str)
+            if user_connections is not None:
+                user_connections.discard(websocket)
                 
-                # Clean up empty lists
-                if not self.active_connections[user_id_str]:
+                # Clean up empty sets
+                if not user_connections:
                     del self.active_connections[user_id_str]
+                    self._unindex_user(user_id_str)
+        
+        self.disconnects.record()
+    
+    async def _load_followees(self, user_id: uuid.UUID):
+        """Read the accounts a user who just came online follows into the follow index"""
+        user = str(user_id)
+        # Indexed right away, so follows made while the query runs are kept too
+        self.followees.setdefault(user, set())
+        try:
+            async with AsyncSessionLocal() as db:
+                followees = (await db.scalars(
+                    select(Follower.following_id).where(Follower.follower_id == user_id)
+                )).all()
+        except Exception as e:
+            # Home events for this user are missed until it reconnects, but the socket works
+            logger.error(f"Could not load follows of user {user_id}: {e}")
+            followees = []
+        for followee in followees:
+            self._index_follow(user, str(followee))
+    
+    def _index_follow(self, follower: str, following: str):
+        # Only online users are indexed
+        if follower in self.followees:
+            self.followees[follower].add(following)
+            self.online_followers.setdefault(following, set()).add(follower)
+    
+    def _unindex_follow(self, follower: str, following: str):
+        self.followees.get(follower, set()).discard(following)
+        followers = self.online_followers.get(following)
+        if followers is not None:
+            followers.discard(follower)
+            if not followers:
+                del self.online_followers[following]
+    
+    def _unindex_user(self, user: str):
+        """Remove a user whose last connection closed from the follow index"""
+        for following in list(self.followees.get(user, ())):
+            self._unindex_follow(user, following)
+        self.followees.pop(user, None)
+    
+    async def follow(self, follower_id: uuid.UUID, following_id: uuid.UUID):
+        """Update the follow index on every worker after a follow"""
+        await self.pubsub.publish(f"follow:{follower_id},{following_id}\n")
+    
+    async def unfollow(self, follower_id: uuid.UUID, following_id: uuid.UUID):
+        """Update the follow index on every worker after an unfollow"""
+        await self.pubsub.publish(f"unfollow:{follower_id},{following_id}\n")
+    
+    def _topic_targets(self, topic: str) -> Iterable[WebSocket]:
+        """Connections that receive events for a topic or a followers target"""
+        if topic.startswith("followers:"):
+            # Cost grows with the author's online followers, not with all connections
+            author = topic[10:]
+            home = self.topics.get(HOME_TOPIC, set())
+            users = self.online_followers.get(author, set()) | {author}
+            return [websocket for user in users
+                    for websocket in self.active_connections.get(user, ()) if websocket in home]
+        return self.topics.get(topic, ())
+    
+    def _receives(self, connection: Connection, topic: str) -> bool:
+        """Whether a connection gets events for a topic or a followers target"""
+        if topic.startswith("followers:"):
+            author = topic[10:]
+            user = str(connection.user_id)
+            return (HOME_TOPIC in connection.topics
+                    and (author == user or author in self.followees.get(user, ())))
+        return topic in connection.topics
+    
+    def record_activity(self, websocket: WebSocket):
+        """Note that a client sent something, which answers a pending heartbeat"""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+    
+    def drop_connection(self, websocket: WebSocket, code: int):
+        """Unregister a connection and close it in the background"""
+        connection = self.connections.get(websocket)
+        self.disconnect(websocket, connection.user_id if connection else None)
+        asyncio.create_task(self._close(websocket, code))
+    
+    def subscribe(self, websocket: WebSocket, topic: str) -> bool:
+        """Add a connection to a topic; False if it already has too many subscriptions"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return False
+        if topic not in connection.topics and len(connection.topics) >= WS_MAX_SUBSCRIPTIONS:
+            return False
+        connection.topics.add(topic)
+        self.topics.setdefault(topic, set()).add(websocket)
+        return True
+    
+    def unsubscribe(self, websocket: WebSocket, topic: str):
+        """Remove a connection from a topic"""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.topics.discard(topic)
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.topics[topic]
+    
+    def enqueue(self, websocket: WebSocket, message_json: str):
+        """
+        Queue a message for one connection without waiting for it to be sent.
+        A full queue means the client cannot keep up: the message is dropped,
+        and with WS_QUEUE_OVERFLOW=disconnect the client is closed as well.
+        """
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        
+        try:
+            connection.queue.put_nowait(message_json)
+            self.enqueued_messages += 1
+        except asyncio.QueueFull:
+            connection.dropped += 1
+            self.dropped_messages += 1
+            if self.overflow == "disconnect":
+                self.overflow_disconnects += 1
+                logger.warning(f"Closing WebSocket of user {connection.user_id}: send queue full")
+                self.drop_connection(websocket, status.WS_1013_TRY_AGAIN_LATER)
+    
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            # Already closed
+            pass
+    
+    async def send(self, websocket: WebSocket, message: Any):
+        """Send a message to a single connection through its queue"""
+        self.enqueue(websocket, dumps(message))
+    
+    async def publish(self, topics: List[str], message: Any):
+        """Send a message to the subscribers of any of the topics on every worker, once per connection"""
+        message_json = dumps(message)
+        await self.pubsub.publish(f"topics:{','.join(topics)}\n{message_json}")
     
     async def send_personal_message(self, message: Any, user_id: uuid.UUID):
-        """Send a message to a specific user's connections"""
-        user_id_str = str(user_id)
-        if user_id_str in self.active_connections:
-            message_json = message if isinstance(message, str) else json.dumps(message, cls=DateTimeEncoder)
-            
-            # Send to all connections for this user
-            for connection in self.active_connections[user_id_str]:
-                try:
-                    await connection.send_text(message_json)
-                except Exception:
-                    # Connection might be closed
-                    pass
+        """Send a message to the connections subscribed to a user's notifications"""
+        await self.publish([notification_topic(user_id)], message)
     
     async def broadcast(self, message: Any):
-        """Broadcast a message to all connected clients"""
-        message_json = message if isinstance(message, str) else json.dumps(message, cls=DateTimeEncoder)
+        """Broadcast a message to all connected clients on every worker"""
+        message_json = dumps(message)
+        await self.pubsub.publish(f"broadcast\n{message_json}")
+    
+    async def _deliver(self, envelope: str):
+        """
+        Queue a backplane message for this worker's connections. The envelope is
+        a target line ("broadcast" or "topics:<topic>,<topic>") followed by the
+        message JSON, so the message itself is never decoded or re-encoded on the way.
+        Follow index updates travel the same way as "follow:<follower>,<following>"
+        and "unfollow:<follower>,<following>" without a message.
+        """
+        target, _, message_json = envelope.partition("\n")
+        if target == "broadcast":
+            topics = None
+            targets = self.broadcast_connections
+        elif target.startswith("topics:"):
+            topics = target[7:].split(",")
+            if len(topics) == 1:
+                targets = self._topic_targets(topics[0])
+            else:
+                # A connection subscribed to several of the topics gets the event once
+                targets = set()
+                for topic in topics:
+                    targets.update(self._topic_targets(topic))
+        elif target.startswith(("follow:", "unfollow:")):
+            kind, _, pair = target.partition(":")
+            follower, _, following = pair.partition(",")
+            if kind == "follow":
+                self._index_follow(follower, following)
+            else:
+                self._unindex_follow(follower, following)
+            return
+        else:
+            logger.warning(f"Ignoring pub/sub message for unknown target {target!r}")
+            return
         
-        # Send to all connections
-        for connection in self.broadcast_connections:
-            try:
-                await connection.send_text(message_json)
-            except Exception:
-                # Connection might be closed
-                pass
+        # Sequenced and buffered even without local recipients, for clients that reconnect
+        message_json = self.replay.stamp(topics, message_json)
+        
+        # Iterate over a copy, as overflowing clients are removed on the way
+        for websocket in list(targets):
+            self.enqueue(websocket, message_json)
     
-    async def broadcast_post(self, post: dict):
-        """Broadcast a new post to all connected clients"""
-        await self.broadcast({
-            "type": "new_post",
-            "data": post
-        })
-    
-    async def broadcast_like(self, like: dict):
-        """Broadcast a like event to all connected clients"""
-        await self.broadcast({
-            "type": "new_like",
-            "data": like
-        })
-    
-    async def broadcast_repost(self, repost: dict):
-        """Broadcast a repost event to all connected clients"""
-        await self.broadcast({
-            "type": "new_repost",
-            "data": repost
-        })
+    def snapshot(self) -> dict:
+        """Connection and send queue metrics of this worker"""
+        depths = [connection.queue.qsize() for connection in self.connections.values()]
+        return {
+            "connections": len(self.broadcast_connections),
+            "users": len(self.active_connections),
+            "topics": len(self.topics),
+            "follow_index_users": len(self.followees),
+            "follow_index_authors": len(self.online_followers),
+            "connects_total": self.connects.total,
+            "disconnects_total": self.disconnects.total,
+            "connects_per_second": self.connects.per_second(),
+            "disconnects_per_second": self.disconnects.per_second(),
+            "queue_size": self.queue_size,
+            "overflow_policy": self.overflow,
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "enqueued_messages": self.enqueued_messages,
+            "dropped_messages": self.dropped_messages,
+            "overflow_disconnects": self.overflow_disconnects,
+            "coalesced_events": self.post_counters.events if self.post_counters else 0,
+            "post_counter_frames": self.post_counters.frames if self.post_counters else 0,
+            "heartbeats_sent": self.heartbeat.heartbeats,
+            "pong_timeouts": self.heartbeat.pong_timeouts,
+            "broken_connections": self.heartbeat.broken_connections,
+            "replay": self.replay.snapshot(),
+            "pubsub": self.pubsub.snapshot()
+        }
+    
+    async def broadcast_post(self, post: Any):
+        """
+        Send a new post to the feed, its author's topic and either, for replies,
+        the parent post's topic or, like the home timeline, the home topic of the
+        author and its online followers. The post may be a PostResponse or a dict;
+        either way the frame is encoded once and the same string is queued for
+        every recipient.
+        """
+        author_id = _field(post, "author_id")
+        topics = [FEED_TOPIC, user_topic(author_id)]
+        if _field(post, "reply_to_post_id"):
+            topics.append(post_topic(_field(post, "reply_to_post_id")))
+        else:
+            topics.append(followers_target(author_id))
+        await self.publish(topics, encode_event("new_post", post))
+    
+    async def broadcast_like(self, like: Any):
+        """Send a like event (or, when coalescing, a later post_counters frame) to the liked post's subscribers"""
+        if self.post_counters:
+            self.post_counters.add(_field(like, "post_id"), likes=1)
+            return
+        await self.publish([post_topic(_field(like, "post_id"))], encode_event("new_like", like))
+    
+    async def broadcast_repost(self, repost: Any):
+        """Send a repost event to the reposting user's subscribers and the reposted post's subscribers"""
+        topics = [user_topic(_field(repost, "user_id"))]
+        if self.post_counters:
+            self.post_counters.add(_field(repost, "post_id"), reposts=1)
+        else:
+            topics.append(post_topic(_field(repost, "post_id")))
+        await self.publish(topics, encode_event("new_repost", repost))
 
 # Create a global connection manager instance
 manager = ConnectionManager()
-
-# Heartbeat to keep connections alive
-async def heartbeat(websocket: WebSocket):
-    """Send periodic heartbeat to keep WebSocket connections alive"""
-    try:
-        while True:
-            await asyncio.sleep(30)  # Send heartbeat every 30 seconds
-            await websocket.send_text(json.dumps({"type": "heartbeat"}))
-    except Exception:
-        # Connection closed or other error
-        pass 
\ No newline at end of file
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Adjust the import path for both Docker and local environments
+try:
+    # First try direct import (for when PYTHONPATH is set correctly)
+    from src.app.services.websocket import ConnectionManager, post_topic
+except ImportError:
+    # Fallback for local development
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.services.websocket import ConnectionManager, post_topic
+
+class FakeWebSocket:
+    """Stand-in for a client socket; the benchmark measures the registry, not the network"""
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+async def churn(connections: int, users: int, topics: int):
+    """Connect and then disconnect `connections` sockets in random order through a ConnectionManager"""
+    manager = ConnectionManager()
+    sockets = [FakeWebSocket() for _ in range(connections)]
+    user_ids = [f"00000000-0000-0000-0000-{i:012d}" for i in range(users)]
+    # Users without follows, so connecting does not read the follow graph from the database
+    manager.followees.update({user_id: set() for user_id in user_ids})
+
+    start = time.perf_counter()
+    for i, websocket in enumerate(sockets):
+        await manager.connect(websocket, user_ids[i % users])
+        manager.subscribe(websocket, post_topic(f"00000000-0000-0000-0000-{i % topics:012d}"))
+    connect_seconds = time.perf_counter() - start
+
+    random.shuffle(sockets)
+    start = time.perf_counter()
+    for websocket in sockets:
+        manager.disconnect(websocket)
+    disconnect_seconds = time.perf_counter() - start
+
+    # Let the cancelled writer tasks finish
+    await asyncio.sleep(0)
+    await manager.heartbeat.stop()
+    return connect_seconds, disconnect_seconds, manager
+
+def list_registry_baseline(connections: int) -> float:
+    """Disconnect cost of the previous registry, which removed sockets from a plain list"""
+    sockets = [object() for _ in range(connections)]
+    broadcast_connections = list(sockets)
+    random.shuffle(sockets)
+    start = time.perf_counter()
+    for websocket in sockets:
+        if websocket in broadcast_connections:
+            broadcast_connections.remove(websocket)
+    return time.perf_counter() - start
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description="Churn WebSocket connections through the connection registry")
+    parser.add_argument("--connections", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--topics", type=int, default=1000)
+    parser.add_argument("--baseline", type=int, default=20000,
+                        help="connections for the old list-based disconnect (0 to skip; it is quadratic)")
+    args = parser.parse_args()
+
+    connect_seconds, disconnect_seconds, manager = asyncio.run(churn(args.connections, args.users, args.topics))
+    logger.info(f"Connected {args.connections} sockets in {connect_seconds:.2f}s "
+                f"({args.connections / connect_seconds:,.0f}/s)")
+    logger.info(f"Disconnected {args.connections} sockets in {disconnect_seconds:.2f}s "
+                f"({args.connections / disconnect_seconds:,.0f}/s)")
+    logger.info(f"Registry left behind: {len(manager.connections)} connections, "
+                f"{len(manager.active_connections)} users, {len(manager.topics)} topics")
+
+    if args.baseline:
+        baseline_seconds = list_registry_baseline(args.baseline)
+        logger.info(f"List-based disconnect of {args.baseline} sockets took {baseline_seconds:.2f}s "
+                    f"({args.baseline / baseline_seconds:,.0f}/s)")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+from datetime import datetime
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Adjust the import path for both Docker and local environments
+try:
+    # First try direct import (for when PYTHONPATH is set correctly)
+    from src.app.schemas.schema import PostResponse
+    from src.app.services.serialization import encode_event, orjson
+except ImportError:
+    # Fallback for local development
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.schemas.schema import PostResponse
+    from app.services.serialization import encode_event, orjson
+
+class DateTimeEncoder(json.JSONEncoder):
+    """The encoder broadcasts used before the shared serialization layer"""
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        if isinstance(obj, uuid.UUID):
+            return str(obj)
+        return super().default(obj)
+
+def sample_post(images: int) -> PostResponse:
+    """A reply with an author, a parent post and images, like the ones broadcast on creation"""
+    now = datetime.utcnow()
+    author = {"id": uuid.uuid4(), "username": "benchmark_user"}
+    return PostResponse(
+        id=uuid.uuid4(),
+        content="Benchmarking the WebSocket broadcast path " * 8,
+        author_id=author["id"],
+        author=author,
+        created_at=now,
+        updated_at=now,
+        like_count=12,
+        repost_count=3,
+        reply_count=1,
+        reply_to_post_id=uuid.uuid4(),
+        reply_to_post={"id": uuid.uuid4(), "content": "Parent post", "author": author, "created_at": now},
+        images=[{"id": uuid.uuid4(), "image_url": f"/static/media/{uuid.uuid4()}.jpg"} for _ in range(images)]
+    )
+
+def legacy_frame(post: PostResponse) -> str:
+    """Previous path: model_dump() at the call site, then json.dumps with DateTimeEncoder"""
+    return json.dumps({"type": "new_post", "data": post.model_dump()}, cls=DateTimeEncoder)
+
+def current_frame(post: PostResponse) -> str:
+    """Current path: the response model is encoded straight into the frame"""
+    return encode_event("new_post", post)
+
+def measure(fn, post: PostResponse, events: int) -> float:
+    start = time.perf_counter()
+    for _ in range(events):
+        fn(post)
+    return time.perf_counter() - start
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description="Compare WebSocket frame encoding before and after serialize-once")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--images", type=int, default=4)
+    args = parser.parse_args()
+
+    post = sample_post(args.images)
+    if json.loads(legacy_frame(post)) != json.loads(current_frame(post)):
+        raise SystemExit("Encoders disagree on the frame contents")
+
+    logger.info(f"orjson available: {orjson is not None}")
+    legacy_seconds = measure(legacy_frame, post, args.events)
+    logger.info(f"json + DateTimeEncoder: {args.events} events in {legacy_seconds:.2f}s "
+                f"({args.events / legacy_seconds:,.0f} events/s)")
+    current_seconds = measure(current_frame, post, args.events)
+    logger.info(f"encode_event: {args.events} events in {current_seconds:.2f}s "
+                f"({args.events / current_seconds:,.0f} events/s, {legacy_seconds / current_seconds:.1f}x)")
+
+if __name__ == "__main__":
+    run_benchmark()
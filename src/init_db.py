@@ -127,6 +127,49 @@ def create_tables_manually():
         )
         """))
         
+        # Create followers table
+        connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS followers (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            follower_id UUID NOT NULL REFERENCES users(id),
+            following_id UUID NOT NULL REFERENCES users(id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT unique_follower_following UNIQUE (follower_id, following_id)
+        )
+        """))
+        
+        # Create timeline_entries table (materialized home timelines)
+        connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS timeline_entries (
+            user_id UUID NOT NULL REFERENCES users(id),
+            post_id UUID NOT NULL REFERENCES posts(id),
+            author_id UUID NOT NULL REFERENCES users(id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, post_id)
+        )
+        """))
+        
+        # Create indexes for the list and lookup query shapes
+        for index_sql in [
+            "CREATE INDEX IF NOT EXISTS ix_users_created_at_id ON users (created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_posts_created_at_id ON posts (created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_posts_author_id_created_at_id ON posts (author_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_posts_reply_to_post_id_created_at_id ON posts (reply_to_post_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_posts_original_post_id ON posts (original_post_id)",
+            "CREATE INDEX IF NOT EXISTS ix_post_images_post_id_created_at ON post_images (post_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_likes_post_id_created_at ON likes (post_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_reposts_post_id_created_at ON reposts (post_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_media_files_uploader_id_created_at ON media_files (uploader_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_moderation_actions_created_at_id ON moderation_actions (created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_followers_following_id_created_at_id ON followers (following_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_followers_follower_id_created_at_id ON followers (follower_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_timeline_entries_user_id_created_at_post_id ON timeline_entries (user_id, created_at, post_id)",
+            "CREATE INDEX IF NOT EXISTS ix_timeline_entries_user_id_author_id ON timeline_entries (user_id, author_id)",
+            "CREATE INDEX IF NOT EXISTS ix_timeline_entries_post_id ON timeline_entries (post_id)",
+            "CREATE INDEX IF NOT EXISTS ix_timeline_entries_created_at ON timeline_entries (created_at)",
+        ]:
+            connection.execute(text(index_sql))
+        
         # Commit the transaction
         connection.commit()
     
@@ -157,7 +200,8 @@ def initialize_database():
         
         required_tables = [
             "users", "user_profiles", "posts", "post_images", 
-            "likes", "reposts", "media_files", "moderation_actions"
+            "likes", "reposts", "media_files", "moderation_actions",
+            "followers", "timeline_entries"
         ]
         
         missing = [table for table in required_tables if table not in tables]
@@ -11,12 +11,12 @@ logger = logging.getLogger(__name__)
 # Adjust the import path for both Docker and local environments
 try:
     # First try direct import (for when PYTHONPATH is set correctly)
-    from src.app.services.database import engine, SessionLocal
+    from src.app.services.database import engine, SessionLocal, apply_migrations, apply_index_migrations
     from src.app.models.model import Base, UserProfile, User
 except ImportError:
     # Fallback for local development
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from app.services.database import engine, SessionLocal
+    from app.services.database import engine, SessionLocal, apply_migrations, apply_index_migrations
     from app.models.model import Base, UserProfile, User
 
 def run_migration():
@@ -51,6 +51,12 @@ def run_migration():
                 logger.info("following_count column added successfully")
             else:
                 logger.info("following_count column already exists")
+        
+        # Add the columns of later versions, then build the indexes declared on
+        # the models that the database is missing. Index builds run once per
+        # deployment, here, before the workers start.
+        apply_migrations()
+        apply_index_migrations(Base.metadata)
             
         logger.info("Migration completed successfully")
         return True
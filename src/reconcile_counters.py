@@ -0,0 +1,53 @@
+import os
+import sys
+import logging
+from sqlalchemy.exc import SQLAlchemyError
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Adjust the import path for both Docker and local environments
+try:
+    # First try direct import (for when PYTHONPATH is set correctly)
+    from src.app.services.database import SessionLocal
+    from src.app.services.counters import reconcile_counters, COUNTER_BUFFER_ENABLED
+except ImportError:
+    # Fallback for local development
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.services.database import SessionLocal
+    from app.services.counters import reconcile_counters, COUNTER_BUFFER_ENABLED
+
+def run_reconciliation():
+    """
+    Recompute like, repost, reply, follower and following counts from the source tables.
+    Refuses to run while COUNTER_BUFFER_ENABLED is set: API workers may still hold
+    unflushed like/repost deltas, which would be applied on top of the recomputed
+    counts. Stop the workers (they flush on shutdown) or disable the buffer first.
+    """
+    if COUNTER_BUFFER_ENABLED:
+        logger.error("COUNTER_BUFFER_ENABLED is set; stop the API workers and run with COUNTER_BUFFER_ENABLED=false")
+        return False
+
+    logger.info("Starting counter reconciliation...")
+
+    db = SessionLocal()
+    try:
+        fixed = reconcile_counters(db)
+        logger.info(f"Corrected counters on {fixed['posts']} posts and {fixed['user_profiles']} user profiles")
+        return True
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Database error during reconciliation: {str(e)}")
+        return False
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    success = run_reconciliation()
+    if success:
+        logger.info("Counter reconciliation completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("Counter reconciliation failed")
+        sys.exit(1)
@@ -0,0 +1,45 @@
+import os
+import sys
+import logging
+from sqlalchemy.exc import SQLAlchemyError
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Adjust the import path for both Docker and local environments
+try:
+    # First try direct import (for when PYTHONPATH is set correctly)
+    from src.app.services.database import SessionLocal
+    from src.app.services.timeline import trim_timelines, HOME_TIMELINE_RETENTION_DAYS
+except ImportError:
+    # Fallback for local development
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.services.database import SessionLocal
+    from app.services.timeline import trim_timelines, HOME_TIMELINE_RETENTION_DAYS
+
+def run_trim():
+    """Remove home timeline entries older than HOME_TIMELINE_RETENTION_DAYS."""
+    logger.info(f"Trimming timeline entries older than {HOME_TIMELINE_RETENTION_DAYS} days...")
+
+    db = SessionLocal()
+    try:
+        removed = trim_timelines(db)
+        db.commit()
+        logger.info(f"Removed {removed} timeline entries")
+        return True
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Database error while trimming timelines: {str(e)}")
+        return False
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    success = run_trim()
+    if success:
+        logger.info("Timeline trimming completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("Timeline trimming failed")
+        sys.exit(1)
@@ -0,0 +1,82 @@
+import asyncio
+from collections import defaultdict
+
+def encode(reply) -> bytes:
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, bytes):
+        return f"${len(reply)}\r\n".encode() + reply + b"\r\n"
+    if isinstance(reply, list):
+        return f"*{len(reply)}\r\n".encode() + b"".join(encode(item) for item in reply)
+    return f"-{reply}\r\n".encode()
+
+async def read_command(reader: asyncio.StreamReader):
+    """Read one RESP array of bulk strings, or None when the client is gone"""
+    line = await reader.readline()
+    if not line:
+        return None
+    args = []
+    for _ in range(int(line[1:-2])):
+        length = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+class RespServer:
+    """Stand-in for a Redis server that only knows PUBLISH and SUBSCRIBE"""
+
+    def __init__(self):
+        self.port = None
+        self._server = None
+        self._subscribers = defaultdict(set)
+        self._writers = set()
+
+    async def start(self, port: int = 0):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    def subscriber_count(self, channel: bytes) -> int:
+        return len(self._subscribers[channel])
+
+    def drop_connections(self):
+        """Close every client connection, as a restarting server would"""
+        for writer in list(self._writers):
+            writer.close()
+        self._subscribers.clear()
+
+    async def stop(self):
+        self._server.close()
+        self.drop_connections()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while True:
+                command = await read_command(reader)
+                if command is None:
+                    break
+                name = command[0].upper()
+                if name == b"SUBSCRIBE":
+                    for channel in command[1:]:
+                        self._subscribers[channel].add(writer)
+                        writer.write(encode([b"subscribe", channel, 1]))
+                elif name == b"PUBLISH":
+                    channel, message = command[1], command[2]
+                    receivers = [w for w in self._subscribers[channel] if not w.is_closing()]
+                    for subscriber in receivers:
+                        subscriber.write(encode([b"message", channel, message]))
+                    writer.write(encode(len(receivers)))
+                else:
+                    writer.write(encode(f"ERR unknown command '{name.decode()}'"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            for subscribers in self._subscribers.values():
+                subscribers.discard(writer)
+            writer.close()
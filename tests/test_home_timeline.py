@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.model import User, UserProfile, Post, Follower
+from app.services import crud, timeline
+from app.services.pagination import encode_cursor
+
+@pytest.fixture
+def home(db, monkeypatch):
+    monkeypatch.setattr(timeline, "HOME_TIMELINE_FANOUT_LIMIT", 1)
+    reader, friend, star = (
+        User(email=f"{name}@example.com", username=name, hashed_password="x")
+        for name in ("reader", "friend", "star")
+    )
+    db.add_all([reader, friend, star])
+    db.commit()
+    db.add_all([UserProfile(user_id=user.id, follower_count=0) for user in (reader, friend, star)])
+    db.add_all([
+        Follower(follower_id=reader.id, following_id=friend.id),
+        Follower(follower_id=reader.id, following_id=star.id),
+    ])
+    db.commit()
+    
+    start = datetime(2024, 1, 1)
+    expected = []
+    for minute, author in enumerate([friend, star, reader, friend, star, reader, star, friend]):
+        post = Post(content=f"post {minute}", author_id=author.id, created_at=start + timedelta(minutes=minute))
+        db.add(post)
+        db.commit()
+        # The star's first post is fanned out before they cross the fan-out limit
+        if minute == 2:
+            db.query(UserProfile).filter(UserProfile.user_id == star.id).update({"follower_count": 5})
+            db.commit()
+        timeline.fan_out_post(db, post)
+        db.commit()
+        expected.append(post.id)
+    
+    reply = Post(content="reply", author_id=reader.id, reply_to_post_id=expected[0], created_at=start + timedelta(hours=1))
+    db.add(reply)
+    db.commit()
+    return reader.id, expected[::-1]
+
+def test_home_feed_merges_timeline_entries_with_read_time_authors(db, home):
+    reader_id, expected = home
+    posts = crud.get_home_feed(db, reader_id, limit=20)
+    assert [post.id for post in posts] == expected
+
+def test_home_feed_cursor_pages_match_offset_pages(db, home):
+    reader_id, expected = home
+    first = crud.get_home_feed(db, reader_id, limit=3)
+    after_first = crud.get_home_feed(db, reader_id, limit=3, cursor=encode_cursor(first[-1].created_at, first[-1].id))
+    assert [post.id for post in first] == expected[:3]
+    assert [post.id for post in after_first] == expected[3:6]
+    assert [post.id for post in crud.get_home_feed(db, reader_id, skip=3, limit=3)] == expected[3:6]
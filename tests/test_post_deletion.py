@@ -0,0 +1,66 @@
+import pytest
+
+from app.models.model import User, Post, Repost
+from app.schemas.schema import ReplyCreate
+from app.services import crud, deletion
+
+@pytest.fixture
+def users(db):
+    author = User(email="author@example.com", username="author", hashed_password="x")
+    reader = User(email="reader@example.com", username="reader", hashed_password="x")
+    db.add_all([author, reader])
+    db.commit()
+    return author.id, reader.id
+
+def test_deleting_a_reposted_post_keeps_the_repost(db, users):
+    author_id, reader_id = users
+    post = Post(content="original", author_id=author_id)
+    db.add(post)
+    db.commit()
+    post_id = post.id
+    crud.create_repost(db, reader_id, post_id)
+    
+    crud.delete_post(db, post_id, author_id)
+    
+    db.expire_all()
+    assert db.get(Post, post_id) is None
+    assert db.query(Repost).count() == 0
+    repost_post = db.query(Post).filter(Post.author_id == reader_id).one()
+    assert repost_post.original_post_id is None
+
+def reply_to_new_post(db, author_id):
+    parent = Post(content="parent", author_id=author_id)
+    db.add(parent)
+    db.commit()
+    reply = crud.create_reply(db, author_id, ReplyCreate(content="reply", reply_to_post_id=parent.id))
+    return parent.id, reply.id
+
+def test_background_deletion_decrements_reply_count(db, session_factory, users, monkeypatch):
+    author_id, _ = users
+    parent_id, reply_id = reply_to_new_post(db, author_id)
+    monkeypatch.setattr(deletion, "SessionLocal", session_factory)
+    
+    job = crud.delete_post(db, reply_id, author_id, background=True)
+    deletion.run_deletion_job(job["job_id"])
+    
+    db.expire_all()
+    assert deletion.get_deletion_job(job["job_id"])["status"] == "completed"
+    assert db.get(Post, reply_id) is None
+    assert db.get(Post, parent_id).reply_count == 0
+
+def test_failed_background_deletion_keeps_reply_count(db, session_factory, users, monkeypatch):
+    author_id, _ = users
+    parent_id, reply_id = reply_to_new_post(db, author_id)
+    monkeypatch.setattr(deletion, "SessionLocal", session_factory)
+    
+    def fail(db, post_ids):
+        raise RuntimeError("database went away")
+    monkeypatch.setattr(deletion, "delete_post_batch", fail)
+    
+    job = crud.delete_post(db, reply_id, author_id, background=True)
+    deletion.run_deletion_job(job["job_id"])
+    
+    db.expire_all()
+    assert deletion.get_deletion_job(job["job_id"])["status"] == "failed"
+    assert db.get(Post, reply_id) is not None
+    assert db.get(Post, parent_id).reply_count == 1
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from app.services.pubsub import RedisPubSub
+from resp_server import RespServer
+
+CHANNEL = "test:events"
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def server():
+    server = RespServer()
+    await server.start()
+    yield server
+    await server.stop()
+
+def backplane(url: str):
+    received = []
+    async def on_message(message: str):
+        received.append(message)
+    return RedisPubSub(on_message, url=url, channel=CHANNEL), received
+
+async def wait_for(condition, timeout: float = 5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+@pytest.mark.anyio
+async def test_messages_reach_every_instance_once_and_in_order(server):
+    first, first_received = backplane(server.url)
+    second, second_received = backplane(server.url)
+    await first.start()
+    await second.start()
+    await wait_for(lambda: server.subscriber_count(CHANNEL.encode()) == 2)
+
+    messages = [f"event {i}" for i in range(50)]
+    await asyncio.gather(*(first.publish(message) for message in messages))
+    await wait_for(lambda: len(second_received) == len(messages))
+    await wait_for(lambda: len(first_received) == len(messages))
+
+    assert second_received == messages
+    assert first_received == messages
+    assert first.published == len(messages)
+    assert first.publish_errors == 0
+    await first.stop()
+    await second.stop()
+
+@pytest.mark.anyio
+async def test_reconnects_after_the_server_drops_the_connection(server):
+    first, first_received = backplane(server.url)
+    second, second_received = backplane(server.url)
+    await first.start()
+    await second.start()
+    await wait_for(lambda: server.subscriber_count(CHANNEL.encode()) == 2)
+    await first.publish("before")
+
+    server.drop_connections()
+    await wait_for(lambda: first.reconnects == 1 and second.reconnects == 1)
+    await wait_for(lambda: server.subscriber_count(CHANNEL.encode()) == 2)
+    await first.publish("after")
+    await wait_for(lambda: len(second_received) == 2)
+
+    assert second_received == ["before", "after"]
+    assert first_received == ["before", "after"]
+    await first.stop()
+    await second.stop()
+
+@pytest.mark.anyio
+async def test_delivers_locally_while_the_server_is_down(server):
+    pubsub, received = backplane(server.url)
+    await server.stop()
+    await pubsub.start()
+
+    await pubsub.publish("while down")
+
+    assert received == ["while down"]
+    assert pubsub.publish_errors == 1
+    assert pubsub.published == 0
+    await pubsub.stop()
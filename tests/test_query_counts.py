@@ -0,0 +1,59 @@
+import pytest
+from sqlalchemy import event
+
+from app.models.model import User, Post, PostImage
+from app.schemas.schema import PostResponse
+from app.services import crud
+
+PAGE_SIZES = (5, 20, 50)
+
+@pytest.fixture
+def data(db):
+    """Posts with images by one author, and replies with images by several authors to one post"""
+    authors = [User(email=f"user{i}@example.com", username=f"user{i}", hashed_password="x") for i in range(10)]
+    db.add_all(authors)
+    db.flush()
+    
+    parent = Post(content="parent", author_id=authors[0].id)
+    db.add(parent)
+    db.flush()
+    
+    # Enough posts by one author, and replies to one post, to fill the largest page
+    for i in range(60):
+        post = Post(content=f"post {i}", author_id=authors[0].id)
+        reply = Post(content=f"reply {i}", author_id=authors[i % len(authors)].id, reply_to_post_id=parent.id)
+        db.add_all([post, reply])
+        db.flush()
+        db.add_all([PostImage(post_id=p.id, image_url=f"/static/{p.id}-{n}.jpg") for p in (post, reply) for n in range(2)])
+    db.commit()
+    return {"author_id": authors[0].id, "parent_id": parent.id}
+
+def count_queries(db, fetch) -> int:
+    """Statements run to load a page and serialize it the way the API does"""
+    db.expunge_all()
+    statements = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        posts = fetch()
+        [PostResponse.model_validate(post) for post in posts]
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return len(statements)
+
+@pytest.mark.parametrize("page", ["feed", "user_posts", "replies"])
+def test_query_count_does_not_grow_with_page_size(db, data, page):
+    fetchers = {
+        "feed": lambda limit: crud.get_feed(db, limit=limit),
+        "user_posts": lambda limit: crud.get_user_posts(db, data["author_id"], limit=limit),
+        "replies": lambda limit: crud.get_post_replies(db, data["parent_id"], limit=limit),
+    }
+    fetch = fetchers[page]
+    
+    counts = {limit: count_queries(db, lambda: fetch(limit)) for limit in PAGE_SIZES}
+    
+    assert len(set(counts.values())) == 1, f"queries per page size: {counts}"